@@ -1,21 +1,29 @@
 ﻿# anuncios/app_anuncios.py
 
+from __future__ import annotations
+
 import os
+import re
 from datetime import date
 from io import BytesIO
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Mapping
 
 import gspread
-import jinja2
-import pandas as pd
 import streamlit as st
-from docxtpl import DocxTemplate
 from google.oauth2.service_account import Credentials
 
-from utils import fecha_larga, safe_filename_pretty  # función común en utils.py
+from utils import fecha_larga, safe_filename_pretty, tamano_grilla  # funciones comunes en utils.py
 
 #  CODART (SUNAT) para autocompletar
 from integraciones.codart import CodartAPIError, consultar_dni, consultar_ruc
 
+# pandas, jinja2 y docxtpl (vía plantillas_docx) se importan dentro de las
+# funciones que los usan (BD / Excel / Word): app_main importa este módulo al
+# arrancar aunque el usuario elija otro módulo en la barra lateral.
+if TYPE_CHECKING:
+    import pandas as pd
+
 
 # ============================================================================
 # CONFIGURACIÓN GOOGLE SHEETS (USANDO STREAMLIT SECRETS)
@@ -70,16 +78,23 @@ COLUMNAS_OFICIALES = [
 # ============================================================================
 
 @st.cache_resource
-def get_worksheet():
+def _get_client():
     """
-    Crea el cliente de Google Sheets usando st.secrets y devuelve la hoja de trabajo.
+    Crea el cliente de Google Sheets usando st.secrets.
     Se cachea para no reautenticar en cada interacción.
     """
     creds_info = st.secrets["gcp_service_account"]
     creds = Credentials.from_service_account_info(creds_info, scopes=SCOPES)
-    client = gspread.authorize(creds)
+    return gspread.authorize(creds)
+
 
-    sh = client.open_by_key(SPREADSHEET_ID)
+@st.cache_resource
+def get_worksheet():
+    """
+    Devuelve la hoja de trabajo de la BD. La verificación de encabezados
+    corre una sola vez por proceso (al crear el recurso).
+    """
+    sh = _get_client().open_by_key(SPREADSHEET_ID)
     try:
         ws = sh.worksheet(SHEET_NAME)
     except gspread.exceptions.WorksheetNotFound:
@@ -87,56 +102,125 @@ def get_worksheet():
         ws = sh.sheet1
 
     # Si la hoja está vacía, ponemos la fila de encabezados
-    values = ws.get_all_values()
-    if not values:
-        ws.update("A1", [COLUMNAS_OFICIALES])
+    # (solo leemos la fila 1, no toda la hoja)
+    header = ws.row_values(1)
+    if not header:
+        ws.update(values=[COLUMNAS_OFICIALES], range_name="A1", value_input_option="RAW")
 
     return ws
 
 
-def leer_bd_certificados() -> pd.DataFrame:
+@st.cache_data(ttl=60, show_spinner=False)
+def _leer_bd_cached(version: int) -> pd.DataFrame:
     """
-    Lee toda la BD desde Google Sheets y la devuelve como DataFrame.
-    Si no hay datos, devuelve un DF vacío con las columnas oficiales.
+    Lectura real de la hoja. `version` solo sirve como clave de caché:
+    se incrementa cada vez que escribimos en la BD.
     """
+    import pandas as pd
+
     ws = get_worksheet()
-    values = ws.get_all_values()
+    # Pedimos la hoja por columnas: cada lista es [encabezado, valor1, valor2, ...]
+    # y va directo a pandas sin transponer filas.
+    columnas = ws.get_values(major_dimension="COLUMNS")
 
-    if not values:
+    if not columnas:
         return pd.DataFrame(columns=COLUMNAS_OFICIALES)
 
-    header = values[0]
-    rows = values[1:]
+    por_nombre = {col[0]: col[1:] for col in columnas if col}
+    n_filas = max(len(col) for col in columnas) - 1
+    vacia = [""] * n_filas
+
+    # Aseguramos columnas oficiales (y su orden); las que faltan van vacías
+    return pd.DataFrame(
+        {
+            nombre: por_nombre[nombre] + [""] * (n_filas - len(por_nombre[nombre]))
+            if nombre in por_nombre
+            else vacia
+            for nombre in COLUMNAS_OFICIALES
+        },
+        columns=COLUMNAS_OFICIALES,
+    )
 
-    df = pd.DataFrame(rows, columns=header)
 
-    # Aseguramos columnas oficiales
-    for col in COLUMNAS_OFICIALES:
-        if col not in df.columns:
-            df[col] = ""
+def leer_bd_certificados() -> pd.DataFrame:
+    """
+    Lee toda la BD desde Google Sheets y la devuelve como DataFrame.
+    Si no hay datos, devuelve un DF vacío con las columnas oficiales.
+    Usa caché (60 s o hasta la próxima escritura) para no consultar la hoja
+    en cada rerun de Streamlit.
+    """
+    return _leer_bd_cached(st.session_state.get("bd_version", 0))
 
-    df = df[COLUMNAS_OFICIALES]
-    return df
+
+def _invalidar_bd_cache():
+    st.session_state["bd_version"] = st.session_state.get("bd_version", 0) + 1
+    _leer_bd_cached.clear()
 
 
 def escribir_bd_certificados(df: pd.DataFrame):
     """
     Sobrescribe la BD en Google Sheets con el contenido del DataFrame.
+    Solo para reescrituras completas (p. ej. el editor de la BD); las altas
+    nuevas se agregan con append_rows en guardar_certificado_en_bd.
     """
     ws = get_worksheet()
 
-    df = df.copy()
-    # Aseguramos columnas y orden
-    for col in COLUMNAS_OFICIALES:
-        if col not in df.columns:
-            df[col] = ""
-    df = df[COLUMNAS_OFICIALES]
-    df = df.fillna("")
+    # Aseguramos columnas y orden en un solo paso (reindex ya devuelve copia)
+    df = df.reindex(columns=COLUMNAS_OFICIALES, fill_value="")
+    arr = df.fillna("").to_numpy(dtype=object)
+
+    # Casi todo ya es str: solo convertimos las celdas que no lo son
+    values = [df.columns.tolist()] + [
+        [x if isinstance(x, str) else str(x) for x in row] for row in arr
+    ]
+
+    # Una sola escritura: borra los valores de toda la hoja (tal como está
+    # ahora en Sheets, aunque otra sesión haya agregado filas; el formato queda),
+    # agranda la grilla si la tabla no entra y escribe desde A1.
+    filas, cols = tamano_grilla(ws)
+    requests = [{"updateCells": {"range": {"sheetId": ws.id}, "fields": "userEnteredValue"}}]
+    if len(values) > filas:
+        requests.append(
+            {"appendDimension": {"sheetId": ws.id, "dimension": "ROWS", "length": len(values) - filas}}
+        )
+    if len(COLUMNAS_OFICIALES) > cols:
+        requests.append(
+            {
+                "appendDimension": {
+                    "sheetId": ws.id,
+                    "dimension": "COLUMNS",
+                    "length": len(COLUMNAS_OFICIALES) - cols,
+                }
+            }
+        )
+    requests.append(
+        {
+            "updateCells": {
+                "start": {"sheetId": ws.id, "rowIndex": 0, "columnIndex": 0},
+                "rows": [
+                    {"values": [{"userEnteredValue": {"stringValue": v}} for v in fila]}
+                    for fila in values
+                ],
+                "fields": "userEnteredValue",
+            }
+        }
+    )
+    ws.spreadsheet.batch_update({"requests": requests})
+    _invalidar_bd_cache()
+
 
-    values = [df.columns.tolist()] + df.astype(str).values.tolist()
+@st.cache_data(ttl=60, max_entries=4, show_spinner=False)
+def _bd_a_excel(df: pd.DataFrame) -> bytes:
+    """
+    Excel de la BD para descarga. Cacheado por contenido del DataFrame:
+    mientras la BD no cambie, los reruns reutilizan los mismos bytes.
+    """
+    import pandas as pd
 
-    ws.clear()
-    ws.update("A1", values)
+    buffer = BytesIO()
+    with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
+        df.to_excel(writer, sheet_name="Certificados", index=False)
+    return buffer.getvalue()
 
 
 # ============================================================================
@@ -154,7 +238,9 @@ def split_nombre_apellidos(nombre_raw: str):
     if not nombre_raw:
         return "", "", ""
 
-    partes = str(nombre_raw).strip().upper().split()
+    partes = str(nombre_raw).upper().split()
+    if not partes:
+        return "", "", ""
     if len(partes) == 1:
         return partes[0], "", ""
     elif len(partes) == 2:
@@ -164,10 +250,16 @@ def split_nombre_apellidos(nombre_raw: str):
     else:
         ape_pat = partes[0]
         ape_mat = partes[1]
+        # Espacios repetidos entre los nombres quedan en uno solo
         nombres = " ".join(partes[2:])
     return ape_pat, ape_mat, nombres
 
 
+# Campos de la evaluación que van a la BD solo con strip / con strip + mayúsculas
+_STR_KEYS = ("num_ds", "ruc", "coordenadas")
+_UPPER_KEYS = ("direccion", "ubicacion", "leyenda", "tipo_anuncio")
+
+
 def guardar_certificado_en_bd(
     eval_ctx,
     vigencia_txt,
@@ -208,13 +300,9 @@ def guardar_certificado_en_bd(
     else:
         fecha_ingreso_str = str(fecha_ingreso_val or "").strip()
 
-    # Campos comunes desde la evaluación
-    num_ds_val = str(eval_ctx.get("num_ds", "")).strip()
-    ruc_empresa = str(eval_ctx.get("ruc", "")).strip()
-    direccion = str(eval_ctx.get("direccion", "")).strip().upper()
-    ubicacion = str(eval_ctx.get("ubicacion", "")).strip().upper()
-    leyenda = str(eval_ctx.get("leyenda", "")).strip().upper()
-    tipo_anuncio = str(eval_ctx.get("tipo_anuncio", "")).strip().upper()
+    # Campos comunes desde la evaluación (normalizados en una sola pasada)
+    campos = {k: str(eval_ctx.get(k, "")).strip() for k in _STR_KEYS}
+    campos_mayus = {k: str(eval_ctx.get(k, "")).strip().upper() for k in _UPPER_KEYS}
     largo = eval_ctx.get("largo", "")
     alto = eval_ctx.get("alto", "")
     grosor = eval_ctx.get("grosor", "")
@@ -222,47 +310,48 @@ def guardar_certificado_en_bd(
     color = eval_ctx.get("colores", "")
     material = eval_ctx.get("material", "")
     num_caras = eval_ctx.get("num_cara", "")
-    coordenadas = str(eval_ctx.get("coordenadas", "")).strip()
-
-    nueva_fila = {
-        "EXP": num_ds_val,
-        "N° RECIBO": num_recibo,
-        "FECHA DE INGRESO": fecha_ingreso_str,  # ahora se guarda en la BD
-        "RUC DE LA EMPRESA": ruc_empresa,
-        "NÚMERO DE AUTORIZACION ": n_certificado,
-        "FECHA DE EMISIÓN DE LA AUTORIZACION": fecha_emision_str,
-        "FECHA DE EXPIRACIÓN DE LA AUTORIZACION": fecha_expiracion_str,
-        "TIPO DE DOCUMENTO DE IDENTIDAD DEL SOLICITANTE": doc_tipo,
-        "NÚMERO DE DOCUMENTO DE IDENTIDAD DEL SOLICITANTE": doc_num,
-        "APELLIDO PATERNO DEL SOLICITANTE": ape_pat,
-        "APELLIDO MATERNO DEL SOLICITANTE": ape_mat,
-        "NOMBRE DEL SOLICITANTE": nombres,
-        "RAZÓN SOCIAL DEL SOLICITANTE": razon_social,
-        "CARACTERISTICA FISICA DEL PANEL": fisico,
-        "CARACTERISTICA TECNICA DEL PANEL": tecnico,
-        "TIPO DE ANUNCIPO PUBLICITARIO (Móvil, paneles, banderolas, etc.)": tipo_anuncio,
-        "DIRECCION": direccion,
-        "UBICACIÓN": ubicacion,
-        "LEYENDA": leyenda,
-        "LARGO": largo,
-        "ALTO": alto,
-        "ANCHO": "",  # por ahora no lo capturamos en el formulario
-        "GROSOR": grosor,
-        "LONGUITUD DE SOPORTES": altura_soporte,
-        "COLOR": color,
-        "MATERIAL": material,
-        "N° CARAS": num_caras,
-        "COORDENADAS": coordenadas,
-    }
-
-    # Leemos la BD actual, concatenamos y reescribimos todo
-    try:
-        df = leer_bd_certificados()
-    except Exception:
-        df = pd.DataFrame(columns=COLUMNAS_OFICIALES)
 
-    df = pd.concat([df, pd.DataFrame([nueva_fila])], ignore_index=True)
-    escribir_bd_certificados(df)
+    # Fila en el mismo orden que COLUMNAS_OFICIALES (va directo a append_rows)
+    nueva_fila = [
+        campos["num_ds"],              # EXP
+        num_recibo,                    # N° RECIBO
+        fecha_ingreso_str,             # FECHA DE INGRESO
+        campos["ruc"],                 # RUC DE LA EMPRESA
+        n_certificado,                 # NÚMERO DE AUTORIZACION
+        fecha_emision_str,             # FECHA DE EMISIÓN DE LA AUTORIZACION
+        fecha_expiracion_str,          # FECHA DE EXPIRACIÓN DE LA AUTORIZACION
+        doc_tipo,                      # TIPO DE DOCUMENTO DE IDENTIDAD DEL SOLICITANTE
+        doc_num,                       # NÚMERO DE DOCUMENTO DE IDENTIDAD DEL SOLICITANTE
+        ape_pat,                       # APELLIDO PATERNO DEL SOLICITANTE
+        ape_mat,                       # APELLIDO MATERNO DEL SOLICITANTE
+        nombres,                       # NOMBRE DEL SOLICITANTE
+        razon_social,                  # RAZÓN SOCIAL DEL SOLICITANTE
+        fisico,                        # CARACTERISTICA FISICA DEL PANEL
+        tecnico,                       # CARACTERISTICA TECNICA DEL PANEL
+        campos_mayus["tipo_anuncio"],  # TIPO DE ANUNCIPO PUBLICITARIO (...)
+        campos_mayus["direccion"],     # DIRECCION
+        campos_mayus["ubicacion"],     # UBICACIÓN
+        campos_mayus["leyenda"],       # LEYENDA
+        largo,                         # LARGO
+        alto,                          # ALTO
+        "",                            # ANCHO (por ahora no lo capturamos en el formulario)
+        grosor,                        # GROSOR
+        altura_soporte,                # LONGUITUD DE SOPORTES
+        color,                         # COLOR
+        material,                      # MATERIAL
+        num_caras,                     # N° CARAS
+        campos["coordenadas"],         # COORDENADAS
+    ]
+
+    # Solo agregamos la fila nueva al final (sin leer ni reescribir toda la hoja)
+    row_values = ["" if v is None else str(v) for v in nueva_fila]
+    get_worksheet().append_rows(
+        [row_values],
+        value_input_option="RAW",
+        insert_data_option="INSERT_ROWS",
+        table_range="A1",
+    )
+    _invalidar_bd_cache()
 
 
 # ============================================================================
@@ -279,68 +368,73 @@ def _init_anuncios_state():
     st.session_state.setdefault("anuncio_lookup_msg", "")
 
 
+# RUC válido: exactamente 11 dígitos
+_RUC_RE = re.compile(r"\A\d{11}\Z")
+
+# Claves donde SUNAT/CODART puede traer la razón social, en orden de preferencia
+_RAZON_KEYS = (
+    "razon_social",  # tu caso exacto: result.razon_social
+    "razonSocial",
+    "nombre_razon_social",
+    "nombreRazonSocial",
+    "nombre",
+    "full_name",
+)
+
+
 def _extract_razon_social(res: dict) -> str:
     # Si viene anidado en "result", úsalo
     data = res.get("result") if isinstance(res, dict) else None
     if not isinstance(data, dict):
         data = res if isinstance(res, dict) else {}
 
-    # Tu caso exacto: result.razon_social
-    return (
-        (data.get("razon_social") or "").strip()
-        or (data.get("razonSocial") or "").strip()
-        or (data.get("nombre_razon_social") or "").strip()
-        or (data.get("nombreRazonSocial") or "").strip()
-        or (data.get("nombre") or "").strip()
-        or (data.get("full_name") or "").strip()
-    )
+    # Primera clave con texto no vacío (cortamos apenas encontramos una)
+    for k in _RAZON_KEYS:
+        v = data.get(k)
+        if isinstance(v, str) and (v := v.strip()):
+            return v
+    return ""
 
 
 def _cb_autocomplete_ruc():
-    ruc = (st.session_state.get("ruc_sol") or "").strip()
-    st.session_state["anuncio_lookup_msg"] = ""
+    ss = st.session_state
+    ruc = (ss.get("ruc_sol") or "").strip()
+    ss["anuncio_lookup_msg"] = ""
 
     if not ruc:
         return
 
-    if not (ruc.isdigit() and len(ruc) == 11):
-        st.session_state["anuncio_lookup_msg"] = "⚠️ RUC inválido (debe tener 11 dígitos)."
+    if not _RUC_RE.match(ruc):
+        ss["anuncio_lookup_msg"] = "⚠️ RUC inválido (debe tener 11 dígitos)."
         return
 
     try:
-        res = consultar_ruc(ruc)
-        razon = _extract_razon_social(res)
+        # consultar_ruc ya cachea las respuestas (caché común a todos los módulos)
+        razon = _extract_razon_social(consultar_ruc(ruc))
 
         if razon:
-            st.session_state["nombre_sol"] = razon
+            ss["nombre_sol"] = razon
             # mensaje simple de confirmación
             if ruc.startswith("10"):
-                st.session_state["anuncio_lookup_msg"] = "✅ RUC 10 OK: nombre autocompletado."
+                ss["anuncio_lookup_msg"] = "✅ RUC 10 OK: nombre autocompletado."
             elif ruc.startswith("20"):
-                st.session_state["anuncio_lookup_msg"] = "✅ RUC 20 OK: razón social autocompletada."
+                ss["anuncio_lookup_msg"] = "✅ RUC 20 OK: razón social autocompletada."
             else:
-                st.session_state["anuncio_lookup_msg"] = "✅ RUC OK: solicitante autocompletado."
+                ss["anuncio_lookup_msg"] = "✅ RUC OK: solicitante autocompletado."
         else:
-            st.session_state["anuncio_lookup_msg"] = "⚠️ RUC OK, pero no vino razón social/nombre."
+            ss["anuncio_lookup_msg"] = "⚠️ RUC OK, pero no vino razón social/nombre."
 
     except (ValueError, CodartAPIError) as e:
-        st.session_state["anuncio_lookup_msg"] = f"⚠️ {e}"
+        ss["anuncio_lookup_msg"] = f"⚠️ {e}"
     except Exception as e:
-        st.session_state["anuncio_lookup_msg"] = f"⚠️ Error inesperado consultando RUC: {e}"
+        ss["anuncio_lookup_msg"] = f"⚠️ Error inesperado consultando RUC: {e}"
 
 
 # ============================================================================
-# Módulo principal (Streamlit)
+# ESTILOS
 # ============================================================================
 
-def run_modulo_anuncios():
-    st.header("📢 Anuncios Publicitarios – Evaluación y Certificado")
-
-    _init_anuncios_state()
-
-    # Estilos visuales tipo card
-    st.markdown(
-        """
+_CSS_ANUNCIOS = """
         <style>
         .block-container { padding-top: 1.0rem; max-width: 900px; }
         .stButton>button {
@@ -368,28 +462,149 @@ def run_modulo_anuncios():
             border-top: 1px solid rgba(148, 163, 184, 0.35);
         }
         </style>
-        """,
+"""
+
+
+# ============================================================================
+# PLANTILLAS WORD
+# ============================================================================
+
+# Rutas de plantillas (carpeta en la RAÍZ del proyecto), de solo lectura
+TEMPLATES_EVAL: Mapping[str, str] = MappingProxyType({
+    "PANEL SIMPLE - AZOTEAS": "plantillas_publicidad/evaluacion_panel_simple_azotea.docx",
+    "LETRAS RECORTADAS": "plantillas_publicidad/evaluacion_letras_recortadas.docx",
+    "PANEL SIMPLE - ESTACIONES DE SERVICIO": "plantillas_publicidad/evaluacion_panel_simple_estacion.docx",
+    "TOLDO SENCILLO": "plantillas_publicidad/evaluacion_toldo_sencillo.docx",
+    "PANEL SENCILLO Y LUMINOSO": "plantillas_publicidad/evaluacion_panel_sencillo_luminoso.docx",
+})
+
+TEMPLATES_CERT: Mapping[str, str] = MappingProxyType({
+    "PANEL SIMPLE - AZOTEAS": "plantillas_publicidad/certificado_panel_simple_azotea.docx",
+    "LETRAS RECORTADAS": "plantillas_publicidad/certificado_letras_recortadas.docx",
+    "PANEL SIMPLE - ESTACIONES DE SERVICIO": "plantillas_publicidad/certificado_panel_simple_estacion.docx",
+    "TOLDO SENCILLO": "plantillas_publicidad/certificado_toldo_sencillo.docx",
+    "PANEL SENCILLO Y LUMINOSO": "plantillas_publicidad/certificado_panel_sencillo_luminoso.docx",
+})
+
+# Campos de la evaluación que el certificado copia tal cual
+_CERT_KEYS = (
+    "num_ds", "nombre", "direccion", "ubicacion", "largo", "alto",
+    "grosor", "altura", "material", "fisico", "tecnico",
+)
+
+_TIPOS_ANUNCIO = tuple(TEMPLATES_EVAL)
+_RUTAS_PLANTILLAS = tuple(TEMPLATES_EVAL.values()) + tuple(TEMPLATES_CERT.values())
+
+
+@st.cache_resource(show_spinner=False)
+def _precalentar_plantillas(rutas: tuple) -> None:
+    """Una sola vez por proceso: lee, parcha y precompila las plantillas de anuncios."""
+    from plantillas_docx import precalentar
+
+    precalentar(rutas, autoescape=True)
+
+
+def _renderizar_plantillas(trabajos: list) -> list | None:
+    """
+    Bytes de cada (ruta, contexto, etiqueta) renderizado con autoescape, en el
+    mismo orden; con más de una plantilla se renderizan a la vez.
+    Un error de sintaxis de Jinja se muestra y devuelve None; los demás
+    errores se propagan.
+    """
+    import jinja2
+    from plantillas_docx import renderizar_docx, renderizar_en_paralelo
+
+    try:
+        if len(trabajos) == 1:
+            ruta, contexto, _ = trabajos[0]
+            return [renderizar_docx(ruta, contexto, autoescape=True)]
+        return renderizar_en_paralelo([(ruta, contexto, True) for ruta, contexto, _ in trabajos])
+    except jinja2.TemplateSyntaxError as e:
+        etiquetas = " / ".join(etiqueta for _, _, etiqueta in trabajos)
+        st.error(f"Hay un error de sintaxis en la plantilla de {etiquetas}.")
+        st.error(f"Plantilla: {', '.join(ruta for ruta, _, _ in trabajos)}")
+        st.error(f"Mensaje: {e.message}")
+        st.error(f"Línea aproximada en el XML: {e.lineno}")
+        return None
+
+
+def _renderizar_plantilla(ruta: str, contexto: dict, etiqueta: str) -> bytes | None:
+    """Una sola plantilla (ver _renderizar_plantillas)."""
+    documentos = _renderizar_plantillas([(ruta, contexto, etiqueta)])
+    return documentos[0] if documentos else None
+
+
+@st.fragment
+def _fragment_bd():
+    """
+    Sección de la BD como fragmento: editar celdas o guardar solo vuelve a
+    ejecutar esta parte, no los formularios de evaluación / certificado.
+    """
+    st.markdown('<hr class="section-divider" />', unsafe_allow_html=True)
+    st.markdown(
+        '<div class="section-title">Base de datos de certificados</div>',
         unsafe_allow_html=True,
     )
 
+    try:
+        df_bd = leer_bd_certificados()
+    except Exception as e:
+        df_bd = None
+        st.error(f"No se pudo leer la BD en Google Sheets: {e}")
+
+    if df_bd is not None and not df_bd.empty:
+        with st.expander("Ver / editar base de datos"):
+            edited_df = st.data_editor(
+                df_bd,
+                num_rows="dynamic",
+                use_container_width=True,
+                key="editor_bd_certificados",
+            )
+            st.caption(
+                "Puedes editar celdas o agregar / eliminar filas. "
+                "Luego guarda los cambios en la hoja de cálculo."
+            )
+
+            if st.button("💾 Guardar cambios en BD (Google Sheets)"):
+                try:
+                    escribir_bd_certificados(edited_df)
+                    st.success("Cambios guardados correctamente en Google Sheets.")
+                except Exception as e:
+                    st.error(f"No se pudo actualizar la BD: {e}")
+
+        # Usamos lo que se ve en pantalla (edited_df) para la descarga
+        st.download_button(
+            "⬇️ Descargar BD como Excel",
+            data=_bd_a_excel(edited_df),
+            file_name="BD_CERTIFICADOS_ANUNCIO.xlsx",
+            mime=(
+                "application/vnd.openxmlformats-"
+                "officedocument.spreadsheetml.document"
+            ),
+        )
+    else:
+        st.info(
+            "Aún no hay registros en la base de datos de Google Sheets. "
+            "Cuando guardes un certificado, se empezará a llenar."
+        )
+
+
+# ============================================================================
+# Módulo principal (Streamlit)
+# ============================================================================
+
+def run_modulo_anuncios():
+    st.header("📢 Anuncios Publicitarios – Evaluación y Certificado")
+
+    _init_anuncios_state()
+
+    # Estilos visuales tipo card
+    st.markdown(_CSS_ANUNCIOS, unsafe_allow_html=True)
+
     st.markdown('<div class="card">', unsafe_allow_html=True)
 
-    # ========= Rutas de plantillas (carpeta en la RAÍZ del proyecto) =========
-    TEMPLATES_EVAL = {
-        "PANEL SIMPLE - AZOTEAS": "plantillas_publicidad/evaluacion_panel_simple_azotea.docx",
-        "LETRAS RECORTADAS": "plantillas_publicidad/evaluacion_letras_recortadas.docx",
-        "PANEL SIMPLE - ESTACIONES DE SERVICIO": "plantillas_publicidad/evaluacion_panel_simple_estacion.docx",
-        "TOLDO SENCILLO": "plantillas_publicidad/evaluacion_toldo_sencillo.docx",
-        "PANEL SENCILLO Y LUMINOSO": "plantillas_publicidad/evaluacion_panel_sencillo_luminoso.docx",
-    }
-
-    TEMPLATES_CERT = {
-        "PANEL SIMPLE - AZOTEAS": "plantillas_publicidad/certificado_panel_simple_azotea.docx",
-        "LETRAS RECORTADAS": "plantillas_publicidad/certificado_letras_recortadas.docx",
-        "PANEL SIMPLE - ESTACIONES DE SERVICIO": "plantillas_publicidad/certificado_panel_simple_estacion.docx",
-        "TOLDO SENCILLO": "plantillas_publicidad/certificado_toldo_sencillo.docx",
-        "PANEL SENCILLO Y LUMINOSO": "plantillas_publicidad/certificado_panel_sencillo_luminoso.docx",
-    }
+    # Deja las 10 plantillas parseadas en caché antes del primer clic
+    _precalentar_plantillas(_RUTAS_PLANTILLAS)
 
     # -------------------- Selección de tipo de anuncio --------------------
     st.markdown(
@@ -398,13 +613,16 @@ def run_modulo_anuncios():
     )
     tipo_anuncio = st.selectbox(
         "Selecciona el tipo de anuncio",
-        list(TEMPLATES_EVAL.keys()),
+        _TIPOS_ANUNCIO,
     )
 
     st.markdown('<hr class="section-divider" />', unsafe_allow_html=True)
 
     # ------------------------------------------------------------------ #
-    # DATOS DEL SOLICITANTE (FUERA DEL FORM PARA SER DINÁMICO)           #
+    # DATOS DEL SOLICITANTE                                              #
+    # Fuera del form solo lo que debe reaccionar al momento: el tipo de  #
+    # contribuyente (muestra/oculta el representante) y el RUC (su       #
+    # on_change autocompleta el nombre; los forms no admiten callbacks). #
     # ------------------------------------------------------------------ #
     st.markdown(
         '<div class="section-title">Datos del solicitante</div>',
@@ -421,45 +639,13 @@ def run_modulo_anuncios():
     es_ruc20 = tipo_ruc_label.startswith("RUC 20")
     tipo_ruc = "20" if es_ruc20 else "10"
 
-    col1, col2 = st.columns(2)
-    with col1:
-        nombre = st.text_input(
-            "Solicitante (nombre completo o razón social)",
-            max_chars=150,
-            key="nombre_sol",
-        )
-
-        # Ahora sí aparece inmediatamente al cambiar a RUC 20
-        if es_ruc20:
-            representante = st.text_input(
-                "Representante legal (solo RUC 20)",
-                max_chars=150,
-                key="representante_sol",
-                placeholder="Nombre completo del representante",
-            )
-        else:
-            representante = ""
-
-        direccion = st.text_input(
-            "Dirección del solicitante",
-            max_chars=200,
-            key="direccion_sol",
-        )
-        coordenadas = st.text_input(
-            "Coordenadas (lat, lon)",
-            max_chars=80,
-            key="coordenadas_sol",
-            placeholder="Ej.: -12.158784, -76.887945",
-        )
-
-    with col2:
-        ruc = st.text_input(
-            "RUC",
-            max_chars=11,
-            key="ruc_sol",
-            on_change=_cb_autocomplete_ruc,  # autocomplete SUNAT
-            placeholder="Digita el ruc",
-        )
+    ruc = st.text_input(
+        "RUC",
+        max_chars=11,
+        key="ruc_sol",
+        on_change=_cb_autocomplete_ruc,  # autocomplete SUNAT
+        placeholder="Digita el ruc",
+    )
 
     msg = (st.session_state.get("anuncio_lookup_msg") or "").strip()
     if msg:
@@ -468,13 +654,47 @@ def run_modulo_anuncios():
         else:
             st.warning(msg)
 
-    st.markdown('<hr class="section-divider" />', unsafe_allow_html=True)
-
     # ------------------------------------------------------------------ #
     #                         MÓDULO 1 · EVALUACIÓN                      #
     # ------------------------------------------------------------------ #
+    # El resto de datos del solicitante va dentro del form: escribir en
+    # ellos ya no provoca un rerun por campo, solo al enviar.
     with st.form("form_evaluacion"):
 
+        col1, col2 = st.columns(2)
+        with col1:
+            nombre = st.text_input(
+                "Solicitante (nombre completo o razón social)",
+                max_chars=150,
+                key="nombre_sol",
+            )
+
+            # Aparece inmediatamente al cambiar a RUC 20 (el radio está fuera del form)
+            if es_ruc20:
+                representante = st.text_input(
+                    "Representante legal (solo RUC 20)",
+                    max_chars=150,
+                    key="representante_sol",
+                    placeholder="Nombre completo del representante",
+                )
+            else:
+                representante = ""
+
+        with col2:
+            direccion = st.text_input(
+                "Dirección del solicitante",
+                max_chars=200,
+                key="direccion_sol",
+            )
+            coordenadas = st.text_input(
+                "Coordenadas (lat, lon)",
+                max_chars=80,
+                key="coordenadas_sol",
+                placeholder="Ej.: -12.158784, -76.887945",
+            )
+
+        st.markdown('<hr class="section-divider" />', unsafe_allow_html=True)
+
         st.markdown(
             '<div class="section-title">Evaluación del anuncio</div>',
             unsafe_allow_html=True,
@@ -618,32 +838,22 @@ def run_modulo_anuncios():
             st.session_state["anuncio_eval_ctx"] = contexto_eval
 
             try:
-                doc = DocxTemplate(template_path)
-                doc.render(contexto_eval, autoescape=True)
-
-                buffer = BytesIO()
-                doc.save(buffer)
-                buffer.seek(0)
-
-                base_name = f"EA {n_anuncio}_exp{num_ds}_{nombre.lower()}"
-                nombre_archivo = safe_filename_pretty(base_name) + ".docx"
-
-                st.success("Evaluación generada correctamente.")
-                st.download_button(
-                    label="⬇️ Descargar evaluación en Word",
-                    data=buffer,
-                    file_name=nombre_archivo,
-                    mime=(
-                        "application/vnd.openxmlformats-"
-                        "officedocument.wordprocessingml.document"
-                    ),
-                )
+                docx_bytes = _renderizar_plantilla(template_path, contexto_eval, "EVALUACIÓN")
+                if docx_bytes is not None:
+                    base_name = f"EA {n_anuncio}_exp{num_ds}_{nombre.lower()}"
+                    nombre_archivo = safe_filename_pretty(base_name) + ".docx"
+
+                    st.success("Evaluación generada correctamente.")
+                    st.download_button(
+                        label="⬇️ Descargar evaluación en Word",
+                        data=docx_bytes,
+                        file_name=nombre_archivo,
+                        mime=(
+                            "application/vnd.openxmlformats-"
+                            "officedocument.wordprocessingml.document"
+                        ),
+                    )
 
-            except jinja2.TemplateSyntaxError as e:
-                st.error("Hay un error de sintaxis en la plantilla de EVALUACIÓN.")
-                st.error(f"Plantilla: {template_path}")
-                st.error(f"Mensaje: {e.message}")
-                st.error(f"Línea aproximada en el XML: {e.lineno}")
             except Exception as e:
                 st.error(f"Ocurrió un error al generar el documento de evaluación: {e}")
 
@@ -727,10 +937,16 @@ def run_modulo_anuncios():
                     key="num_recibo",
                 )
 
-            generar_cert = st.form_submit_button("📜 Generar certificado (.docx)")
+            col_btn1, col_btn2 = st.columns(2)
+            with col_btn1:
+                generar_cert = st.form_submit_button("📜 Generar certificado (.docx)")
+            with col_btn2:
+                generar_ambos = st.form_submit_button("📦 Generar evaluación + certificado")
+            generar_cert = generar_cert or generar_ambos
     else:
         st.info("Primero genera la **Evaluación** para poder armar el certificado.")
         generar_cert = False
+        generar_ambos = False
         n_certificado = ""
         fecha_cert = None
         vigencia_tipo = "INDETERMINADA"
@@ -774,67 +990,68 @@ def run_modulo_anuncios():
             if not cert_template_path:
                 st.error("No se encontró plantilla de certificado para este tipo de anuncio.")
             else:
-                contexto_cert = {
-                    "n_certificado": n_certificado,
-                    "num_ds": eval_ctx.get("num_ds", ""),
-                    "vigencia": vigencia_txt,
-                    "ordenanza": ordenanza,
-                    "nombre": eval_ctx.get("nombre", ""),
-                    "direccion": eval_ctx.get("direccion", ""),
-                    "ubicacion": eval_ctx.get("ubicacion", ""),
-                    "largo": eval_ctx.get("largo", ""),
-                    "alto": eval_ctx.get("alto", ""),
-                    "grosor": eval_ctx.get("grosor", ""),
-                    "altura": eval_ctx.get("altura", ""),
-                    "material": eval_ctx.get("material", ""),
-                    "fisico": eval_ctx.get("fisico", ""),
-                    "tecnico": eval_ctx.get("tecnico", ""),
-                    "fecha": fecha_larga(fecha_cert) if fecha_cert else "",
-                }
-
-                try:
-                    doc = DocxTemplate(cert_template_path)
-                    doc.render(contexto_cert, autoescape=True)
-
-                    buffer = BytesIO()
-                    doc.save(buffer)
-                    buffer.seek(0)
-
-                    num_ds_val = str(eval_ctx.get("num_ds", "")).strip()
-                    nombre_val = str(eval_ctx.get("nombre", "")).strip().upper()
+                contexto_cert = {k: eval_ctx.get(k, "") for k in _CERT_KEYS}
+                contexto_cert.update(
+                    n_certificado=n_certificado,
+                    vigencia=vigencia_txt,
+                    ordenanza=ordenanza,
+                    fecha=fecha_larga(fecha_cert) if fecha_cert else "",
+                )
 
-                    base_name_cert = f"CERT {n_certificado}_EXP {num_ds_val}_{nombre_val}"
-                    nombre_archivo_cert = safe_filename_pretty(base_name_cert) + ".docx"
+                trabajos = [(cert_template_path, contexto_cert, "CERTIFICADO")]
+                if generar_ambos:
+                    # Ambos documentos son independientes: se renderizan a la vez
+                    eval_template_path = TEMPLATES_EVAL[eval_ctx.get("tipo_anuncio", tipo_anuncio)]
+                    trabajos.insert(0, (eval_template_path, eval_ctx, "EVALUACIÓN"))
 
-                    st.success("Certificado generado correctamente.")
-                    st.download_button(
-                        label="⬇️ Descargar certificado en Word",
-                        data=buffer,
-                        file_name=nombre_archivo_cert,
-                        mime=(
-                            "application/vnd.openxmlformats-"
-                            "officedocument.wordprocessingml.document"
-                        ),
-                    )
+                try:
+                    documentos = _renderizar_plantillas(trabajos)
+                    if documentos is not None:
+                        docx_bytes = documentos[-1]
+                        num_ds_val = str(eval_ctx.get("num_ds", "")).strip()
+                        nombre_val = str(eval_ctx.get("nombre", "")).strip().upper()
+
+                        base_name_cert = f"CERT {n_certificado}_EXP {num_ds_val}_{nombre_val}"
+                        nombre_archivo_cert = safe_filename_pretty(base_name_cert) + ".docx"
+
+                        st.success("Certificado generado correctamente.")
+                        if generar_ambos:
+                            base_name_eval = (
+                                f"EA {eval_ctx.get('n_anuncio', '')}_exp{num_ds_val}_"
+                                f"{str(eval_ctx.get('nombre', '')).lower()}"
+                            )
+                            st.download_button(
+                                label="⬇️ Descargar evaluación en Word",
+                                data=documentos[0],
+                                file_name=safe_filename_pretty(base_name_eval) + ".docx",
+                                mime=(
+                                    "application/vnd.openxmlformats-"
+                                    "officedocument.wordprocessingml.document"
+                                ),
+                            )
+                        st.download_button(
+                            label="⬇️ Descargar certificado en Word",
+                            data=docx_bytes,
+                            file_name=nombre_archivo_cert,
+                            mime=(
+                                "application/vnd.openxmlformats-"
+                                "officedocument.wordprocessingml.document"
+                            ),
+                        )
+
+                        # Guardamos en sesión para luego registrar en BD
+                        st.session_state["anuncio_ultimo_cert_eval"] = eval_ctx
+                        st.session_state["anuncio_ultimo_cert_meta"] = {
+                            "vigencia_txt": vigencia_txt,
+                            "n_certificado": n_certificado,
+                            "fecha_cert": fecha_cert,
+                            "fisico": eval_ctx.get("fisico", ""),
+                            "tecnico": eval_ctx.get("tecnico", ""),
+                            "doc_tipo": doc_tipo,
+                            "doc_num": doc_num,
+                            "num_recibo": num_recibo,
+                        }
 
-                    # Guardamos en sesión para luego registrar en BD
-                    st.session_state["anuncio_ultimo_cert_eval"] = eval_ctx
-                    st.session_state["anuncio_ultimo_cert_meta"] = {
-                        "vigencia_txt": vigencia_txt,
-                        "n_certificado": n_certificado,
-                        "fecha_cert": fecha_cert,
-                        "fisico": eval_ctx.get("fisico", ""),
-                        "tecnico": eval_ctx.get("tecnico", ""),
-                        "doc_tipo": doc_tipo,
-                        "doc_num": doc_num,
-                        "num_recibo": num_recibo,
-                    }
-
-                except jinja2.TemplateSyntaxError as e:
-                    st.error("Hay un error de sintaxis en la plantilla de CERTIFICADO.")
-                    st.error(f"Plantilla: {cert_template_path}")
-                    st.error(f"Mensaje: {e.message}")
-                    st.error(f"Línea aproximada en el XML: {e.lineno}")
                 except Exception as e:
                     st.error(f"Ocurrió un error al generar el certificado: {e}")
 
@@ -876,59 +1093,7 @@ def run_modulo_anuncios():
     # ------------------------------------------------------------------ #
     #     VER / EDITAR / DESCARGAR BD DESDE GOOGLE SHEETS                #
     # ------------------------------------------------------------------ #
-    st.markdown('<hr class="section-divider" />', unsafe_allow_html=True)
-    st.markdown(
-        '<div class="section-title">Base de datos de certificados</div>',
-        unsafe_allow_html=True,
-    )
-
-    try:
-        df_bd = leer_bd_certificados()
-    except Exception as e:
-        df_bd = None
-        st.error(f"No se pudo leer la BD en Google Sheets: {e}")
-
-    if df_bd is not None and not df_bd.empty:
-        with st.expander("Ver / editar base de datos"):
-            edited_df = st.data_editor(
-                df_bd,
-                num_rows="dynamic",
-                use_container_width=True,
-                key="editor_bd_certificados",
-            )
-            st.caption(
-                "Puedes editar celdas o agregar / eliminar filas. "
-                "Luego guarda los cambios en la hoja de cálculo."
-            )
-
-            if st.button("💾 Guardar cambios en BD (Google Sheets)"):
-                try:
-                    escribir_bd_certificados(edited_df)
-                    st.success("Cambios guardados correctamente en Google Sheets.")
-                except Exception as e:
-                    st.error(f"No se pudo actualizar la BD: {e}")
-
-        # Usamos lo que se ve en pantalla (edited_df) para la descarga
-        buffer = BytesIO()
-        with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-            edited_df.to_excel(writer, sheet_name="Certificados", index=False)
-
-        buffer.seek(0)
-
-        st.download_button(
-            "⬇️ Descargar BD como Excel",
-            data=buffer,
-            file_name="BD_CERTIFICADOS_ANUNCIO.xlsx",
-            mime=(
-                "application/vnd.openxmlformats-"
-                "officedocument.spreadsheetml.document"
-            ),
-        )
-    else:
-        st.info(
-            "Aún no hay registros en la base de datos de Google Sheets. "
-            "Cuando guardes un certificado, se empezará a llenar."
-        )
+    _fragment_bd()
 
     st.markdown("</div>", unsafe_allow_html=True)
 
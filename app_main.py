@@ -11,9 +11,9 @@ SYSTEM_NAME = "Plataforma Integral de Tramites Municipales"
 SYSTEM_SUBTITLE = "SGLCA - Gestion de Licencias, Documentos y Evaluaciones"
 
 
-def _inject_main_styles() -> None:
-    st.markdown(
-        """
+# Estilos globales: se arman una vez al importar; en cada rerun solo se emiten
+# (Streamlit quita del DOM los elementos que un rerun no vuelve a dibujar).
+_MAIN_CSS = """
         <style>
         .block-container {
             max-width: 1120px;
@@ -79,14 +79,14 @@ def _inject_main_styles() -> None:
             background: #ffffff;
         }
         </style>
-        """,
-        unsafe_allow_html=True,
-    )
+"""
 
 
-def _render_hero() -> None:
-    st.markdown(
-        f"""
+def _inject_main_styles() -> None:
+    st.markdown(_MAIN_CSS, unsafe_allow_html=True)
+
+
+_HERO_HTML = f"""
         <div class="hero-wrap">
             <h1 class="hero-title">{SYSTEM_NAME}</h1>
             <p class="hero-subtitle">{SYSTEM_SUBTITLE}</p>
@@ -97,9 +97,11 @@ def _render_hero() -> None:
                 <span class="hero-chip">Consultas DNI / RUC</span>
             </div>
         </div>
-        """,
-        unsafe_allow_html=True,
-    )
+"""
+
+
+def _render_hero() -> None:
+    st.markdown(_HERO_HTML, unsafe_allow_html=True)
 
 
 def main() -> None:
@@ -123,6 +125,8 @@ def main() -> None:
             "Consultas DNI / RUC (Pruebas)",
         ),
     )
+    # Muestra trazas completas de error en los módulos que las soportan
+    st.sidebar.checkbox("Modo debug", key="debug_mode")
 
     if modulo == "Documentos Simples (Comercio Ambulatorio)":
         run_documentos_comercio()
@@ -1,4 +1,8 @@
-import pandas as pd
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
 import streamlit as st
 
 from integraciones.codart import (
@@ -8,18 +12,32 @@ from integraciones.codart import (
 )
 from comercio.sheets_comercio import (
     append_documento,
-    leer_documentos,
+    append_documentos_batch,
+    leer_documentos_tail,
 )
-# Reutilizamos las opciones de giros y el helper to_upper
-from comercio.app_permisos import GIROS_OPCIONES, to_upper
+# Reutilizamos las opciones de giros
+from comercio.app_permisos import GIROS_OPCIONES
+
+# pandas solo hace falta para la vista de últimos documentos (lo usa
+# sheets_comercio al armar el DataFrame); aquí basta para las anotaciones.
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+def _leer_documentos_recientes(n: int = 50) -> pd.DataFrame:
+    """
+    Últimos `n` registros de Documentos_CA para la vista rápida (lectura por
+    rango, no toda la hoja). La lectura la cachea sheets_comercio y se limpia
+    con cualquier escritura a la BD, también las hechas desde Permisos.
+    """
+    # Columnas con dtype Arrow: st.dataframe envía Arrow al navegador y así
+    # no tiene que convertir columnas object celda por celda en cada rerun.
+    return leer_documentos_tail(n).reset_index(drop=True).convert_dtypes(dtype_backend="pyarrow")
 
 
 def _fmt_fecha_corta(d) -> str:
-    """Devuelve la fecha en formato DD/MM/YYYY."""
-    try:
-        return pd.to_datetime(d).strftime("%d/%m/%Y")
-    except Exception:
-        return ""
+    """Devuelve la fecha en formato DD/MM/YYYY (st.date_input ya da un `date`)."""
+    return d.strftime("%d/%m/%Y") if hasattr(d, "strftime") else ""
 
 
 def _doc_identidad_valido(val: str) -> bool:
@@ -28,18 +46,75 @@ def _doc_identidad_valido(val: str) -> bool:
     - DNI: 8 dígitos
     - CE:  9 dígitos
     """
-    doc = (val or "").strip()
-    return doc.isdigit() and len(doc) in (8, 9)
+    doc = val.strip() if val else ""
+    n = len(doc)
+    # Primero el largo (O(1)); isdigit solo si el largo ya es válido
+    return (n == 8 or n == 9) and doc.isdigit()
+
+
+_TIPO_ASUNTO_OPTS = (
+    "RENOVACION",
+    "SOLICITUD DE COMERCIO AMBULATORIO",
+    "OTROS (especificar)",
+)
+_PROC_OPTS = ("PROCEDENTE", "IMPROCEDENTE")
+
+_GIROS = tuple(GIROS_OPCIONES)
+
+
+@lru_cache(maxsize=len(_GIROS))
+def _giros_excluyendo(giro: str) -> tuple:
+    """Opciones para el segundo giro: todas menos el giro principal."""
+    return tuple(g for g in _GIROS if g != giro)
+
+
+# Estilos (todo en mayúsculas visualmente)
+_CSS_DOCUMENTOS = """
+    <style>
+    .block-container { padding-top: 1.0rem; max-width: 980px; }
+    .card { border: 1px solid #e5e7eb; border-radius: 16px; padding: 16px; margin-bottom: 12px; background: #0f172a08; }
+    .stButton>button { border-radius: 10px; padding: .55rem 1rem; font-weight: 600; }
+    /* solo apariencia, el valor real lo limpiamos en Python */
+    input[type="text"], textarea {
+        text-transform: uppercase;
+    }
+    </style>
+    """
+
+
+# Modo lote: con cuántos D.S. pendientes se sincroniza solo
+LOTE_MAX_PENDIENTES = 20
+
+
+def _sincronizar_pendientes() -> None:
+    """Escribe de una vez los D.S. en cola (modo lote) y vacía la cola."""
+    pendientes = st.session_state["ds_pending"]
+    if not pendientes:
+        return
+    append_documentos_batch(pendientes)
+    n = len(pendientes)
+    st.session_state["ds_pending"] = []
+    st.success(f"{n} Documento(s) Simple(s) sincronizados con la BD.")
 
 
 # ===== Autocomplete DNI solo para este módulo DS =====
 def _init_dni_state_ds():
     st.session_state.setdefault("dni_ds_msg", "")
+    st.session_state.setdefault("ds_pending", [])
 
 
 def _cb_autocomplete_dni_ds():
-    dni_val = (st.session_state.get("dni_ds") or "").strip()
-    st.session_state["dni_ds_msg"] = ""
+    ss = st.session_state
+    dni_val = (ss.get("dni_ds") or "").strip()
+
+    # Mismo DNI que la última consulta correcta (p. ej. se corrigió un typo y
+    # se volvió al valor anterior): no se vuelve a consultar, solo se repone
+    # el aviso de esa consulta (pudo quedar el error de otro DNI).
+    if dni_val and dni_val == ss.get("_last_queried_dni"):
+        ss["dni_ds_msg"] = ss.get("_last_queried_dni_msg", "")
+        return
+
+    ss["dni_ds_msg"] = ""
 
     if not dni_val:
         return
@@ -50,44 +125,30 @@ def _cb_autocomplete_dni_ds():
         return
 
     try:
-        res = consultar_dni(dni_val)
-        nombre = dni_a_nombre_completo(res)
+        # consultar_dni ya cachea las respuestas (caché común a todos los módulos)
+        nombre = dni_a_nombre_completo(consultar_dni(dni_val))
+        ss["_last_queried_dni"] = dni_val
 
         if nombre:
-            st.session_state["nombre_ds"] = nombre
-            st.session_state[
-                "dni_ds_msg"
-            ] = "✅ DNI válido: nombre autocompletado."
+            ss["nombre_ds"] = nombre
+            ss["dni_ds_msg"] = "✅ DNI válido: nombre autocompletado."
         else:
-            st.session_state["dni_ds_msg"] = (
-                "⚠️ DNI OK, pero no se encontró nombre."
-            )
+            ss["dni_ds_msg"] = "⚠️ DNI OK, pero no se encontró nombre."
+        ss["_last_queried_dni_msg"] = ss["dni_ds_msg"]
     except ValueError as e:
-        st.session_state["dni_ds_msg"] = f"⚠️ {e}"
+        ss["dni_ds_msg"] = f"⚠️ {e}"
     except CodartAPIError as e:
-        st.session_state["dni_ds_msg"] = f"⚠️ {e}"
+        ss["dni_ds_msg"] = f"⚠️ {e}"
     except Exception as e:
-        st.session_state["dni_ds_msg"] = f"⚠️ Error consultando DNI: {e}"
+        ss["dni_ds_msg"] = f"⚠️ Error consultando DNI: {e}"
 
 
 def run_documentos_comercio():
     _init_dni_state_ds()
+    ss = st.session_state
 
     # --- Estilos (todo en mayúsculas visualmente) ---
-    st.markdown(
-        """
-    <style>
-    .block-container { padding-top: 1.0rem; max-width: 980px; }
-    .card { border: 1px solid #e5e7eb; border-radius: 16px; padding: 16px; margin-bottom: 12px; background: #0f172a08; }
-    .stButton>button { border-radius: 10px; padding: .55rem 1rem; font-weight: 600; }
-    /* solo apariencia, el valor real lo limpiamos en Python */
-    input[type="text"], textarea {
-        text-transform: uppercase;
-    }
-    </style>
-    """,
-        unsafe_allow_html=True,
-    )
+    st.markdown(_CSS_DOCUMENTOS, unsafe_allow_html=True)
 
     st.title("📥 Registro de Documentos Simples – Comercio Ambulatorio")
     st.caption(
@@ -103,11 +164,7 @@ def run_documentos_comercio():
     # ------------------------------------------------------------------
     tipo_asunto = st.selectbox(
         "Tipo de solicitud*",
-        [
-            "RENOVACION",
-            "SOLICITUD DE COMERCIO AMBULATORIO",
-            "OTROS (especificar)",
-        ],
+        _TIPO_ASUNTO_OPTS,
         key="tipo_asunto_ds",
     )
 
@@ -156,10 +213,10 @@ def run_documentos_comercio():
         nombre = st.text_input(
             "Nombre y apellido*",
             key="nombre_ds",
-            value=st.session_state.get("nombre_ds", ""),
+            value=ss.get("nombre_ds", ""),
         )
 
-    msg_dni = (st.session_state.get("dni_ds_msg") or "").strip()
+    msg_dni = (ss.get("dni_ds_msg") or "").strip()
     if msg_dni:
         if msg_dni.startswith("✅"):
             st.success(msg_dni)
@@ -185,7 +242,7 @@ def run_documentos_comercio():
 
         giro_label_2 = ""
         if add_segundo:
-            opciones_segundo = [g for g in GIROS_OPCIONES if g != giro_label_1]
+            opciones_segundo = _giros_excluyendo(giro_label_1)
             giro_label_2 = st.selectbox(
                 "Segundo giro (opcional)",
                 opciones_segundo,
@@ -217,7 +274,7 @@ def run_documentos_comercio():
 
     procedencia = st.selectbox(
         "Procedente / Improcedente*",
-        ["PROCEDENTE", "IMPROCEDENTE"],
+        _PROC_OPTS,
         key="procedencia_ds",
     )
 
@@ -244,9 +301,16 @@ def run_documentos_comercio():
     st.markdown("</div>", unsafe_allow_html=True)
 
     # ----------------- Botón GUARDAR D.S. -----------------
-    if st.button("💾 Registrar Documento Simple"):
-        falt = []
+    modo_lote = st.checkbox(
+        "Modo lote: acumular varios D.S. y guardarlos juntos",
+        key="ds_modo_lote",
+        help=(
+            "Los D.S. quedan en cola en esta sesión y se guardan en una sola "
+            f"escritura al pulsar Sincronizar (o solos al llegar a {LOTE_MAX_PENDIENTES})."
+        ),
+    )
 
+    if st.button("💾 Registrar Documento Simple"):
         # Asunto que se guarda en la columna ASUNTO
         asunto_final = (
             asunto_otro.strip()
@@ -254,65 +318,96 @@ def run_documentos_comercio():
             else tipo_asunto
         )
 
-        if not fecha_ingreso:
-            falt.append("fecha_ingreso")
-        if not num_ds.strip():
-            falt.append("num_ds")
-        if not asunto_final:
-            falt.append("asunto")
-        if not nombre.strip():
-            falt.append("nombre")
-        if not dni.strip():
-            falt.append("dni")
-        if not domicilio.strip():
-            falt.append("domicilio")
-        if not giro_motivo.strip():
-            falt.append("giro_motivo")
-        if not ubicacion.strip():
-            falt.append("ubicacion")
+        # Un solo strip por campo; se reutiliza al validar y al guardar
+        num_ds = num_ds.strip()
+        nombre = nombre.strip()
+        dni = dni.strip()
+        domicilio = domicilio.strip()
+        giro_motivo = giro_motivo.strip()
+        ubicacion = ubicacion.strip()
+
+        obligatorios = (
+            ("fecha_ingreso", fecha_ingreso),
+            ("num_ds", num_ds),
+            ("asunto", asunto_final),
+            ("nombre", nombre),
+            ("dni", dni),
+            ("domicilio", domicilio),
+            ("giro_motivo", giro_motivo),
+            ("ubicacion", ubicacion),
+        )
+        falt = [campo for campo, valor in obligatorios if not valor]
+
+        # Evita registrar dos veces el mismo D.S. (doble clic o rerun repetido)
+        token = (fecha_ingreso, num_ds, dni)
 
         if dni and (not _doc_identidad_valido(dni)):
             st.error("Documento inválido: debe tener 8 (DNI) o 9 (CE) dígitos.")
         elif falt:
             st.error("Faltan campos obligatorios: " + ", ".join(falt))
+        elif ss.get("_last_submit_token") == token:
+            st.warning("Este Documento Simple ya se registró en esta sesión; no se volvió a guardar.")
         else:
+            # Campos de texto libre: se guardan sin espacios extremos y en
+            # mayúsculas, todos en una sola pasada
+            texto = {
+                "asunto": asunto_final,
+                "nombre": nombre,
+                "domicilio_fiscal": domicilio,
+                "giro_motivo": giro_motivo,
+                "ubicacion_solicitar": ubicacion,
+                "procedencia": procedencia,
+                "num_carta": num_carta,
+                "folios": folios,
+            }
+            datos = {k: (v or "").strip().upper() for k, v in texto.items()}
+            datos.update(
+                fecha_ingreso=_fmt_fecha_corta(fecha_ingreso),
+                num_documento_simple=num_ds,
+                dni=dni,
+                celular=celular.strip(),
+                fecha_carta=_fmt_fecha_corta(fecha_carta) if fecha_carta else "",
+                fecha_notificacion=_fmt_fecha_corta(fecha_notif) if fecha_notif else "",
+                estado="PENDIENTE",
+            )
             try:
-                append_documento(
-                    fecha_ingreso=_fmt_fecha_corta(fecha_ingreso),
-                    num_documento_simple=num_ds.strip(),
-                    asunto=to_upper(asunto_final),
-                    nombre=to_upper(nombre),
-                    dni=dni.strip(),
-                    domicilio_fiscal=to_upper(domicilio),
-                    giro_motivo=to_upper(giro_motivo),
-                    ubicacion_solicitar=to_upper(ubicacion),
-                    celular=celular.strip(),
-                    procedencia=to_upper(procedencia),
-                    num_carta=to_upper(num_carta),
-                    fecha_carta=_fmt_fecha_corta(fecha_carta)
-                    if fecha_carta
-                    else "",
-                    fecha_notificacion=_fmt_fecha_corta(fecha_notif)
-                    if fecha_notif
-                    else "",
-                    folios=to_upper(folios),
-                    estado="PENDIENTE",
-                )
-                st.success("Documento Simple registrado correctamente.")
+                if modo_lote:
+                    ss["ds_pending"].append(datos)
+                    ss["_last_submit_token"] = token
+                    st.success("Documento Simple agregado a la cola (pendiente de sincronizar).")
+                    if len(ss["ds_pending"]) >= LOTE_MAX_PENDIENTES:
+                        _sincronizar_pendientes()
+                else:
+                    append_documento(**datos)
+                    ss["_last_submit_token"] = token
+                    st.success("Documento Simple registrado correctamente.")
             except Exception as e:
                 st.error(f"No se pudo registrar el Documento Simple: {e}")
 
+    # ----------------- Cola del modo lote -----------------
+    n_pend = len(ss["ds_pending"])
+    if n_pend:
+        st.info(f"Hay {n_pend} Documento(s) Simple(s) en cola sin guardar en la BD.")
+        if st.button(f"🔄 Sincronizar ({n_pend} pendientes)"):
+            try:
+                _sincronizar_pendientes()
+            except Exception as e:
+                st.error(f"No se pudieron sincronizar los Documentos Simples: {e}")
+
     # ----------------- Vista rápida de la BD -----------------
     st.markdown("---")
     with st.expander("📊 Ver últimos Documentos registrados"):
-        try:
-            df = leer_documentos()
-            if df.empty:
-                st.info("Aún no hay documentos registrados.")
-            else:
-                st.dataframe(df.tail(50), use_container_width=True)
-        except Exception as e:
-            st.error(f"No se pudo leer la base de datos: {e}")
+        # El cuerpo del expander se ejecuta aunque esté cerrado: la hoja solo
+        # se lee si el usuario lo pide explícitamente.
+        if st.checkbox("Cargar últimos documentos", key="ds_ver_recientes"):
+            try:
+                df = _leer_documentos_recientes()
+                if df.empty:
+                    st.info("Aún no hay documentos registrados.")
+                else:
+                    st.dataframe(df, use_container_width=True)
+            except Exception as e:
+                st.error(f"No se pudo leer la base de datos: {e}")
 
 
 # Para usar este archivo solo (sin app_main.py)
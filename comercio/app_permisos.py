@@ -4,10 +4,10 @@ import io
 import os
 import re
 import traceback
+from collections import namedtuple
+from datetime import date, datetime
 
-import pandas as pd
 import streamlit as st
-from docxtpl import DocxTemplate
 
 from integraciones.codart import (
     CodartAPIError,
@@ -15,13 +15,18 @@ from integraciones.codart import (
     dni_a_nombre_completo,
 )
 
+from utils import (
+    fmt_fecha_corta,
+    fmt_fecha_larga,
+    fmt_fecha_larga_de,
+    safe_filename_pretty,
+    to_upper,
+)
 from comercio.sheets_comercio import (
-    append_evaluacion,
-    append_autorizacion,
     documentos_para_evaluacion,
-    actualizar_estado_documento,
-    leer_evaluaciones,
-    leer_autorizaciones,
+    guardar_todo_bd,
+    leer_eva_y_auto,
+    limpiar_cache_lecturas,
 )
 
 # ========= Utils locales =========
@@ -30,16 +35,6 @@ def asegurar_dirs():
     os.makedirs("plantillas", exist_ok=True)
 
 
-def safe_filename_pretty(texto: str) -> str:
-    prohibidos = '<>:"/\\|?*'
-    limpio = "".join("_" if c in prohibidos else c for c in str(texto))
-    return limpio.replace("\n", " ").replace("\r", " ").strip()
-
-
-def to_upper(s: str) -> str:
-    return (s or "").strip().upper()
-
-
 def text_input_upper(label: str, key: str, **kwargs) -> str:
     """
     Wrapper de text_input que devuelve SIEMPRE en mayúsculas,
@@ -50,40 +45,6 @@ def text_input_upper(label: str, key: str, **kwargs) -> str:
     return to_upper(v)
 
 
-def fmt_fecha_corta(d) -> str:
-    try:
-        return pd.to_datetime(d).strftime("%d/%m/%Y")
-    except Exception:
-        return ""
-
-
-def fmt_fecha_larga(d) -> str:
-    meses = [
-        "enero",
-        "febrero",
-        "marzo",
-        "abril",
-        "mayo",
-        "junio",
-        "julio",
-        "agosto",
-        "setiembre",
-        "octubre",
-        "noviembre",
-        "diciembre",
-    ]
-    try:
-        dt = pd.to_datetime(d)
-        return f"{dt.day} de {meses[dt.month - 1]} del {dt.year}"
-    except Exception:
-        return ""
-
-
-def fmt_fecha_larga_de(d) -> str:
-    t = fmt_fecha_larga(d)
-    return t.replace(" del ", " de ") if t else t
-
-
 def build_vigencia(fi, ff) -> str:
     ini = fmt_fecha_larga_de(fi)
     fin = fmt_fecha_larga_de(ff)
@@ -106,27 +67,39 @@ def _parse_fecha_ddmmaaaa(val):
     """
     Intenta parsear '16/01/2026' → date. Si falla, devuelve None.
     """
+    if type(val) is datetime:
+        return val.date()
+    if type(val) is date:
+        return val
+    try:
+        return datetime.strptime(str(val).strip(), "%d/%m/%Y").date()
+    except ValueError:
+        pass
+    # Otros formatos: que los interprete pandas
     try:
+        import pandas as pd
+
         return pd.to_datetime(val, dayfirst=True).date()
     except Exception:
         return None
 
 
+# "lat,lon" con números decimales simples (signo opcional); los rangos se
+# comprueban después, cuando ya se sabe que float() no va a fallar.
+_COORD_RE = re.compile(
+    r"\s*([+-]?(?:\d+(?:\.\d*)?|\.\d+))\s*,\s*([+-]?(?:\d+(?:\.\d*)?|\.\d+))\s*"
+)
+
+
 def _coordenadas_validas(val: str) -> bool:
     """
     Valida formato: "lat,lon" o "lat, lon" con rangos:
     lat [-90, 90], lon [-180, 180].
     """
-    raw = (val or "").strip()
-    if not raw or "," not in raw:
-        return False
-    lat_txt, lon_txt = [p.strip() for p in raw.split(",", 1)]
-    try:
-        lat = float(lat_txt)
-        lon = float(lon_txt)
-    except Exception:
+    m = _COORD_RE.fullmatch(val or "")
+    if m is None:
         return False
-    return -90 <= lat <= 90 and -180 <= lon <= 180
+    return -90 <= float(m.group(1)) <= 90 and -180 <= float(m.group(2)) <= 180
 
 
 def _doc_identidad_valido(val: str) -> bool:
@@ -136,7 +109,8 @@ def _doc_identidad_valido(val: str) -> bool:
     - CE:  9 dígitos
     """
     doc = (val or "").strip()
-    return doc.isdigit() and len(doc) in (8, 9)
+    # len() es O(1): descarta pegados largos antes de recorrer con isdigit()
+    return len(doc) in (8, 9) and doc.isdigit()
 
 
 def _certificado_anterior_valido(val: str) -> bool:
@@ -172,18 +146,26 @@ def render_doc(context: dict, filename_stem: str, plantilla_path: str):
     if not os.path.exists(plantilla_path):
         st.error(f"No se encontró la plantilla: {plantilla_path}")
         return
-    doc = DocxTemplate(plantilla_path)
+    # docxtpl (lxml + jinja2) se importa recién al generar el primer documento
+    from plantillas_docx import cargar_plantilla
+
+    # Bytes, XML parchado y Environment de Jinja cacheados por plantilla
+    doc = cargar_plantilla(plantilla_path)
     doc.render(context)
     buf = io.BytesIO()
     doc.save(buf)
-    buf.seek(0)
+    # Un solo `bytes` para el disco y para la descarga: download_button guarda
+    # los bytes tal cual (con un BytesIO los volvía a copiar al leerlo).
+    datos = buf.getvalue()
+    buf.close()
     out_name = f"{safe_filename_pretty(filename_stem)}.docx"
-    with open(os.path.join("salidas", out_name), "wb") as f:
-        f.write(buf.getvalue())
+    # Sin búfer intermedio: el .docx completo va en una sola escritura
+    with open(os.path.join("salidas", out_name), "wb", buffering=0) as f:
+        f.write(datos)
     st.success(f"Documento generado: {out_name}")
     st.download_button(
         "⬇️ Descargar .docx",
-        buf,
+        datos,
         file_name=out_name,
         mime=(
             "application/vnd.openxmlformats-"
@@ -192,12 +174,60 @@ def render_doc(context: dict, filename_stem: str, plantilla_path: str):
     )
 
 
+_GENERO_FEMENINO = ("la señora", "la administrada", "identificada", "Sra")
+_GENERO_MASCULINO = ("el señor", "el administrado", "identificado", "Sr")
+_GENERO_LABELS = {"Femenino": _GENERO_FEMENINO, "Masculino": _GENERO_MASCULINO}
+
+
 def genero_labels(sexo: str):
-    return (
-        ("la señora", "la administrada", "identificada", "Sra")
-        if sexo == "Femenino"
-        else ("el señor", "el administrado", "identificado", "Sr")
-    )
+    # Cualquier valor que no sea "Femenino" se trata como masculino
+    return _GENERO_LABELS.get(sexo, _GENERO_MASCULINO)
+
+
+# ========= Contextos de Resolución / Certificado =========
+# Se agrega al domicilio en la Resolución (y en su vista previa)
+SUFIJO_DISTRITO = "-PACHACAMAC"
+
+# Campos que se copian de la evaluación guardada: (clave, cómo se copia).
+# "upper" = to_upper, "strip" = str().strip(), "tal_cual" = sin cambios.
+_CTX_RES_DESDE_EVA = (
+    ("ds", "strip"),
+    ("nombre", "upper"),
+    ("dni", "strip"),
+    ("giro", "strip"),
+    ("rubro", "strip"),
+    ("codigo_rubro", "strip"),
+    ("ubicacion", "strip"),
+    ("horario", "strip"),
+    ("cod_evaluacion", "strip"),
+    ("fecha_evaluacion", "tal_cual"),
+    ("tiempo", "tal_cual"),
+    ("plazo", "tal_cual"),
+)
+_CTX_CERT_DESDE_EVA = (
+    ("ds", "strip"),
+    ("nombre", "upper"),
+    ("dni", "strip"),
+    ("ubicacion", "strip"),
+    ("referencia", "upper"),
+    ("giro", "strip"),
+    ("horario", "strip"),
+    ("tiempo", "tal_cual"),
+    ("plazo", "tal_cual"),
+)
+
+
+def _ctx_desde_eva(esquema, eva: dict) -> dict:
+    ctx = {}
+    for clave, modo in esquema:
+        v = eva.get(clave, "")
+        if modo == "upper":
+            ctx[clave] = to_upper(v)
+        elif modo == "strip":
+            ctx[clave] = str(v).strip()
+        else:
+            ctx[clave] = v
+    return ctx
 
 
 # ========= Catálogo de GIROS / RUBROS según Ordenanza =========
@@ -331,33 +361,49 @@ GIROS_RUBROS = [
 ]
 
 
-GIROS_OPCIONES = [item["label"] for item in GIROS_RUBROS]
+# Catálogo estático en columnas (tuplas paralelas, mismo índice), armado una
+# vez al importar. GIROS_RUBROS queda como fuente legible del catálogo.
+_GIRO_LABELS = tuple(item["label"] for item in GIROS_RUBROS)
+_GIRO_GIROS = tuple(item["giro"] for item in GIROS_RUBROS)
+_GIRO_RUBROS = tuple(item["rubro"] for item in GIROS_RUBROS)
+_GIRO_CODIGOS = tuple(item["codigo"] for item in GIROS_RUBROS)
+_GIRO_LABELS_UP = tuple(label.upper() for label in _GIRO_LABELS)
+
+GIROS_OPCIONES = _GIRO_LABELS
+
+GiroInfo = namedtuple("GiroInfo", "label giro rubro codigo")
+
+# label normalizado -> índice en las columnas
+_GIRO_IDX_BY_LABEL_UP = {label.strip(): i for i, label in enumerate(_GIRO_LABELS_UP)}
+
+
+def _giro_info(idx: int) -> GiroInfo:
+    return GiroInfo(_GIRO_LABELS[idx], _GIRO_GIROS[idx], _GIRO_RUBROS[idx], _GIRO_CODIGOS[idx])
 
 
 def _label_to_info(label: str):
-    """Devuelve el dict de GIROS_RUBROS cuyo label coincida (case-insensitive)."""
-    if not label:
-        return None
-    label_up = label.strip().upper()
-    for item in GIROS_RUBROS:
-        if item["label"].strip().upper() == label_up:
-            return item
-    return None
+    """Devuelve el GiroInfo del catálogo cuyo label coincida (case-insensitive)."""
+    idx = _GIRO_IDX_BY_LABEL_UP.get((label or "").strip().upper())
+    return None if idx is None else _giro_info(idx)
+
+
+# Una sola regex con todos los labels (en mayúsculas): el texto se recorre una
+# vez en C en lugar de buscar cada label por separado.
+_GIRO_LABELS_RE = re.compile("|".join(re.escape(label) for label in _GIRO_LABELS_UP if label))
+# label en mayúsculas -> posición en el catálogo
+_GIRO_ORDEN = {label: i for i, label in enumerate(_GIRO_LABELS_UP)}
+
 
 def _labels_from_raw_giro(giro_motivo_raw: str):
     """
     A partir del texto guardado en BD (en mayúsculas),
     devuelve una lista de labels del catálogo GIROS_RUBROS
-    que aparecen dentro del texto.
+    que aparecen dentro del texto (en el orden del catálogo).
     Sirve tanto para 1 giro como para varios.
     """
     raw_up = (giro_motivo_raw or "").upper()
-    encontrados = []
-    for item in GIROS_RUBROS:
-        lab_up = item["label"].upper()
-        if lab_up and lab_up in raw_up:
-            encontrados.append(item["label"])
-    return encontrados
+    hallados = {_GIRO_ORDEN[m.group(0)] for m in _GIRO_LABELS_RE.finditer(raw_up)}
+    return [_GIRO_LABELS[i] for i in sorted(hallados)]
 
 # ========= Autocomplete DNI (Codart) =========
 def _init_dni_state():
@@ -373,22 +419,19 @@ def _cb_autocomplete_dni():
 
     # Solo consultamos RENIEC para DNI de 8 dígitos.
     # Si es CE (9 dígitos), no consultamos CODART.
-    if not (dni_val.isdigit() and len(dni_val) == 8):
+    if not (len(dni_val) == 8 and dni_val.isdigit()):
         return
 
     try:
+        # consultar_dni ya cachea las respuestas (caché común a todos los módulos)
         res = consultar_dni(dni_val)
         nombre = dni_a_nombre_completo(res)
 
         if nombre:
             st.session_state["nombre"] = to_upper(nombre)
-            st.session_state[
-                "dni_lookup_msg"
-            ] = "✅ DNI válido: nombre autocompletado."
+            st.session_state["dni_lookup_msg"] = "✅ DNI válido: nombre autocompletado."
         else:
-            st.session_state["dni_lookup_msg"] = (
-                "⚠️ DNI OK, pero no se encontró nombre."
-            )
+            st.session_state["dni_lookup_msg"] = "⚠️ DNI OK, pero no se encontró nombre."
     except ValueError as e:
         st.session_state["dni_lookup_msg"] = f"⚠️ {e}"
     except CodartAPIError as e:
@@ -397,13 +440,8 @@ def _cb_autocomplete_dni():
         st.session_state["dni_lookup_msg"] = f"⚠️ Error consultando DNI: {e}"
 
 
-# ========= MÓDULO COMPLETO: evaluación + resolución + certificado =========
-def run_permisos_comercio():
-    asegurar_dirs()
-    _init_dni_state()
-
-    st.markdown(
-        """
+# ========= Estilos =========
+_CSS_PERMISOS = """
     <style>
     .block-container { padding-top: 1.0rem; max-width: 980px; }
     .stButton>button { border-radius: 10px; padding: .55rem 1rem; font-weight: 600; }
@@ -414,9 +452,15 @@ def run_permisos_comercio():
         text-transform: uppercase;
     }
     </style>
-    """,
-        unsafe_allow_html=True,
-    )
+    """
+
+
+# ========= MÓDULO COMPLETO: evaluación + resolución + certificado =========
+def run_permisos_comercio():
+    asegurar_dirs()
+    _init_dni_state()
+
+    st.markdown(_CSS_PERMISOS, unsafe_allow_html=True)
 
     st.title("🧾 Permisos Ambulatorios")
     st.caption(
@@ -438,20 +482,24 @@ def run_permisos_comercio():
     # ----- 1.1 Selección de Documento Simple pendiente (opcional) -----
     st.subheader("1.1 Seleccionar Documento Simple pendiente (opcional)")
 
+    # Lectura cacheada en sheets_comercio (se limpia sola al escribir)
+    if st.button("🔄 Refrescar", key="refrescar_ds_eval"):
+        limpiar_cache_lecturas()
+
     try:
         df_docs = documentos_para_evaluacion()
     except Exception as e:
-        df_docs = pd.DataFrame()
+        df_docs = None
         st.error(f"No se pudo leer Documentos_CA: {e}")
 
     if df_docs is None or df_docs.empty:
         st.caption("No hay Documentos Simples procedentes pendientes.")
     else:
-        opciones = [
-            f"{row['N° DE DOCUMENTO SIMPLE']} · {row['NOMBRE Y APELLIDO']} "
-            f"({row['ASUNTO']})"
-            for _, row in df_docs.iterrows()
-        ]
+        # Etiquetas armadas por columnas (sin iterrows, que crea una Series por fila)
+        cols = df_docs[["N° DE DOCUMENTO SIMPLE", "NOMBRE Y APELLIDO", "ASUNTO"]].astype(str)
+        opciones = (
+            cols.iloc[:, 0] + " · " + cols.iloc[:, 1] + " (" + cols.iloc[:, 2] + ")"
+        ).tolist()
         idx_sel = st.selectbox(
             "Documentos Simples para evaluar",
             options=list(range(len(opciones))),
@@ -460,7 +508,8 @@ def run_permisos_comercio():
         )
 
         if st.button("📥 Cargar datos del D.S. seleccionado"):
-            fila = df_docs.iloc[int(idx_sel)]
+            # dict plano: cada .get() es el de dict, no el de Series
+            fila = df_docs.iloc[int(idx_sel)].to_dict()
 
             st.session_state["ds"] = str(
                 fila.get("N° DE DOCUMENTO SIMPLE", "")
@@ -502,7 +551,7 @@ def run_permisos_comercio():
                 for lab in labels_giro:
                     info = _label_to_info(lab)
                     if info:
-                        descripciones.append(info["giro"])
+                        descripciones.append(info.giro)
                 if descripciones:
                     # Ej.: "Bebidas saludables... y Sándwiches."
                     st.session_state["giro_texto_custom"] = " y ".join(
@@ -605,7 +654,7 @@ def run_permisos_comercio():
     )
 
     giro_info = _label_to_info(giro_label)
-    giro_texto_base = giro_info["giro"] if giro_info else ""
+    giro_texto_base = giro_info.giro if giro_info else ""
     giro_custom = st.session_state.get("giro_texto_custom", "")
     giro_custom_source = st.session_state.get("giro_label_custom_source")
 
@@ -615,8 +664,8 @@ def run_permisos_comercio():
     else:
         giro_texto = giro_texto_base
 
-    rubro_num = giro_info["rubro"] if giro_info else ""
-    codigo_rubro = giro_info["codigo"] if giro_info else ""
+    rubro_num = giro_info.rubro if giro_info else ""
+    codigo_rubro = giro_info.codigo if giro_info else ""
 
     if rubro_num and codigo_rubro:
         st.caption(f"Se usará el rubro {rubro_num} con el código {codigo_rubro}.")
@@ -677,19 +726,26 @@ def run_permisos_comercio():
     st.markdown("</div>", unsafe_allow_html=True)
 
     if st.button("🧾 Generar Evaluación (.docx)"):
+        # Campos obligatorios: (clave, valor, cómo entra al contexto). Una sola
+        # pasada los valida y normaliza; validación y documento usan lo mismo.
+        # Los campos de text_input_upper ya vienen sin espacios y en
+        # mayúsculas: entran tal cual.
+        requeridos = (
+            ("cod_evaluacion", cod_evaluacion, "tal_cual"),
+            ("nombre", nombre, "tal_cual"),
+            ("dni", dni, "strip"),
+            ("domicilio", domicilio, "tal_cual"),
+            ("giro", giro_texto, "tal_cual"),
+            ("ubicacion", ubicacion, "tal_cual"),
+            ("coordenadas", coordenadas, "tal_cual"),
+        )
         falt = []
-        req = {
-            "cod_evaluacion": cod_evaluacion,
-            "nombre": nombre,
-            "dni": dni,
-            "domicilio": domicilio,
-            "giro": giro_texto,
-            "ubicacion": ubicacion,
-            "coordenadas": coordenadas,
-        }
-        for k, v in req.items():
-            if not isinstance(v, str) or not v.strip():
+        ctx_eval = {"sexo": sexo}
+        for k, v, modo in requeridos:
+            limpio = v.strip() if isinstance(v, str) else ""
+            if not limpio:
                 falt.append(k)
+            ctx_eval[k] = limpio if modo == "strip" else v
         if not fecha_ingreso:
             falt.append("fecha_ingreso")
         if not fecha_evaluacion:
@@ -703,21 +759,13 @@ def run_permisos_comercio():
         elif falt:
             st.error("Faltan campos: " + ", ".join(falt))
         else:
-            ctx_eval = {
-                "sexo": sexo,
-                "cod_evaluacion": cod_evaluacion.strip(),
-                "nombre": to_upper(nombre),
-                "dni": dni.strip(),
-                "ds": (ds or "").strip(),
-                "domicilio": to_upper(domicilio),
+            ctx_eval.update({
+                "ds": ds,
                 # En evaluación va en formato corto (DD/MM/YYYY)
                 "fecha_ingreso": fmt_fecha_corta(fecha_ingreso),
                 "fecha_evaluacion": fmt_fecha_larga(fecha_evaluacion),
-                "giro": giro_texto,
-                "ubicacion": ubicacion.strip(),
-                "coordenadas": coordenadas,
-                "referencia": to_upper(referencia),
-                "horario": horario_eval.strip(),
+                "referencia": referencia,
+                "horario": horario_eval,
                 "tiempo": int(tiempo_num),
                 "plazo": _label_plazo(int(tiempo_num), plazo_unidad),
                 "rubro": rubro_num,
@@ -727,12 +775,12 @@ def run_permisos_comercio():
                 "fecha_evaluacion_raw": str(fecha_evaluacion)
                 if fecha_evaluacion
                 else "",
-            }
+            })
             st.session_state["eval_ctx"] = ctx_eval
-            anio_eval = pd.to_datetime(fecha_evaluacion).year
+            anio_eval = fecha_evaluacion.year
             render_doc(
                 ctx_eval,
-                f"EV. N° {cod_evaluacion}-{anio_eval}_{to_upper(nombre)}",
+                f"EV. N° {ctx_eval['cod_evaluacion']}-{anio_eval}_{ctx_eval['nombre']}",
                 TPL_EVAL,
             )
 
@@ -830,7 +878,7 @@ def run_permisos_comercio():
                 "DS": eva.get("ds", ""),
                 "Nombre": eva.get("nombre", ""),
                 "DNI": eva.get("dni", ""),
-                "Domicilio": eva.get("domicilio", "") + "-PACHACAMAC",
+                "Domicilio": eva.get("domicilio", "") + SUFIJO_DISTRITO,
                 "Ubicación": eva.get("ubicacion", ""),
                 "Coordenadas": eva.get("coordenadas", ""),
                 "Giro": eva.get("giro", ""),
@@ -930,13 +978,13 @@ def run_permisos_comercio():
             elif falt:
                 st.error("Faltan campos de Resolución: " + ", ".join(falt))
             else:
-                anio_res = pd.to_datetime(fecha_resolucion).year
+                anio_res = fecha_resolucion.year
                 vigencia_texto = build_vigencia(res_vig_ini, res_vig_fin)
 
-                ctx_res = {
+                ctx_res = _ctx_desde_eva(_CTX_RES_DESDE_EVA, eva)
+                ctx_res.update({
                     "cod_resolucion": str(cod_resolucion).strip(),
                     "fecha_resolucion": fmt_fecha_larga(fecha_resolucion),
-                    "ds": str(eva.get("ds", "")).strip(),
                     # ahora también en largo
                     "fecha_ingreso": fmt_fecha_larga_de(
                         eva.get("fecha_ingreso_raw")
@@ -944,28 +992,16 @@ def run_permisos_comercio():
                     "genero": genero,
                     "genero2": genero2,
                     "genero3": genero3,
-                    "nombre": to_upper(eva.get("nombre", "")),
-                    "dni": str(eva.get("dni", "")).strip(),
-                    "domicilio": to_upper(eva.get("domicilio", ""))
-                    + "-PACHACAMAC",
-                    "giro": str(eva.get("giro", "")).strip(),
-                    "rubro": str(eva.get("rubro", "")).strip(),
-                    "codigo_rubro": str(eva.get("codigo_rubro", "")).strip(),
-                    "ubicacion": str(eva.get("ubicacion", "")).strip(),
-                    "horario": str(eva.get("horario", "")).strip(),
-                    "cod_evaluacion": str(eva.get("cod_evaluacion", "")).strip(),
-                    "fecha_evaluacion": eva.get("fecha_evaluacion", ""),
+                    "domicilio": to_upper(eva.get("domicilio", "")) + SUFIJO_DISTRITO,
                     "cod_certificacion": str(cod_certificacion).strip(),
                     "vigencia": vigencia_texto,
                     "antiguo_certificado": str(antiguo_certificado or "").strip(),
-                    "tiempo": eva.get("tiempo", ""),
-                    "plazo": eva.get("plazo", ""),
-                }
+                })
 
                 tpl = plantilla_por_tipo(res_tipo)
                 render_doc(
                     ctx_res,
-                    f"RS. N° {ctx_res['cod_resolucion']}-{anio_res}_{to_upper(eva.get('nombre',''))}",
+                    f"RS. N° {ctx_res['cod_resolucion']}-{anio_res}_{ctx_res['nombre']}",
                     tpl,
                 )
 
@@ -996,37 +1032,27 @@ def run_permisos_comercio():
             v_vig_fin = st.session_state.get("res_vig_fin", None)
             _, _, _, sr = genero_labels(eva.get("sexo", "Femenino"))
 
-            falt = []
-            if not v_cod_cert:
-                falt.append("cod_certificacion")
-            if not fecha_certificado:
-                falt.append("fecha_certificado")
-            if not eva.get("horario"):
-                falt.append("horario (en Evaluación)")
-            if not v_vig_ini or not v_vig_fin:
-                falt.append("vigencia Inicio/Fin (en Resolución)")
+            requeridos = (
+                ("cod_certificacion", v_cod_cert),
+                ("fecha_certificado", fecha_certificado),
+                ("horario (en Evaluación)", eva.get("horario")),
+                ("vigencia Inicio/Fin (en Resolución)", v_vig_ini and v_vig_fin),
+            )
+            falt = [label for label, v in requeridos if not v]
             if falt:
                 st.error("Faltan campos: " + ", ".join(falt))
             else:
-                anio_cert = pd.to_datetime(fecha_certificado).year
-                ctx_cert = {
+                anio_cert = fecha_certificado.year
+                ctx_cert = _ctx_desde_eva(_CTX_CERT_DESDE_EVA, eva)
+                ctx_cert.update({
                     "codigo_certificado": str(v_cod_cert).strip(),
-                    "ds": str(eva.get("ds", "")).strip(),
                     "sr": sr,
-                    "nombre": to_upper(eva.get("nombre", "")),
-                    "dni": str(eva.get("dni", "")).strip(),
-                    "ubicacion": str(eva.get("ubicacion", "")).strip(),
-                    "referencia": to_upper(eva.get("referencia", "")),
-                    "giro": str(eva.get("giro", "")).strip(),
-                    "horario": str(eva.get("horario", "")).strip(),
-                    "tiempo": eva.get("tiempo", ""),
-                    "plazo": eva.get("plazo", ""),
                     "vigencia2": build_vigencia2(v_vig_ini, v_vig_fin),
                     "fecha_certificado": fmt_fecha_larga(fecha_certificado),
-                }
+                })
                 render_doc(
                     ctx_cert,
-                    f"AU. {ctx_cert['codigo_certificado']}-{anio_cert}_{to_upper(eva.get('nombre',''))}",
+                    f"AU. {ctx_cert['codigo_certificado']}-{anio_cert}_{ctx_cert['nombre']}",
                     TPL_CERT,
                 )
 
@@ -1057,19 +1083,18 @@ def run_permisos_comercio():
             fecha_cert_ant_cad = st.session_state.get("fecha_cert_ant_cad", None)
             antiguo_cert = st.session_state.get("antiguo_certificado", "")
 
-            falt_bd = []
-            if not cod_resolucion_val:
-                falt_bd.append("N° de resolución")
-            if not fecha_resolucion_val:
-                falt_bd.append("Fecha de resolución")
-            if not cod_cert_val:
-                falt_bd.append("N° de certificado")
-            if not fecha_cert_val:
-                falt_bd.append("Fecha del certificado")
-            if not res_vig_ini_val or not res_vig_fin_val:
-                falt_bd.append("Vigencia (inicio/fin) en Resolución")
-            if not _certificado_anterior_valido(str(antiguo_cert or "")):
-                falt_bd.append("Certificado anterior (formato 121 o 187-2025)")
+            requeridos_bd = (
+                ("N° de resolución", cod_resolucion_val),
+                ("Fecha de resolución", fecha_resolucion_val),
+                ("N° de certificado", cod_cert_val),
+                ("Fecha del certificado", fecha_cert_val),
+                ("Vigencia (inicio/fin) en Resolución", res_vig_ini_val and res_vig_fin_val),
+                (
+                    "Certificado anterior (formato 121 o 187-2025)",
+                    _certificado_anterior_valido(str(antiguo_cert or "")),
+                ),
+            )
+            falt_bd = [label for label, v in requeridos_bd if not v]
 
             if falt_bd:
                 st.error(
@@ -1083,7 +1108,7 @@ def run_permisos_comercio():
                     )
 
                     # Evaluaciones_CA
-                    append_evaluacion(
+                    fila_eval = dict(
                         num_ds=eva.get("ds", ""),
                         nombre_completo=eva.get("nombre", ""),
                         cod_evaluacion=eva.get("cod_evaluacion", ""),
@@ -1099,7 +1124,7 @@ def run_permisos_comercio():
                     )
 
                     # Autorizaciones_CA
-                    append_autorizacion(
+                    fila_auto = dict(
                         fecha_ingreso=fmt_fecha_corta(
                             eva.get("fecha_ingreso_raw", "")
                         ),
@@ -1136,43 +1161,51 @@ def run_permisos_comercio():
                         plazo=str(eva.get("plazo", "")),
                     )
 
-                    if eva.get("ds"):
-                        actualizar_estado_documento(
-                            eva.get("ds", ""), "AUTORIZADO"
-                        )
+                    # Una sola escritura para las dos hojas y el ESTADO del D.S.
+                    guardar_todo_bd(
+                        fila_eval,
+                        fila_auto,
+                        num_documento_simple=eva.get("ds", ""),
+                        nuevo_estado="AUTORIZADO",
+                    )
 
                     st.success(
                         "Evaluación, Resolución y Certificado guardados en Google Sheets."
                     )
                 except Exception as e:
-                    tb = traceback.format_exc()
                     st.error(f"No se pudo guardar todo en BD: {e}")
-                    st.code(tb, language="python")
+                    # Traza completa solo con "Modo debug" (barra lateral)
+                    if st.session_state.get("debug_mode"):
+                        st.code(traceback.format_exc(), language="python")
 
     st.markdown("---")
 
     st.subheader("4.2 Ver registros en Google Sheets (solo lectura)")
 
     with st.expander("📊 Ver tablas de Evaluaciones y Autorizaciones"):
-        try:
-            tabs = st.tabs(["Evaluaciones_CA", "Autorizaciones_CA"])
-
-            with tabs[0]:
-                df_eva = leer_evaluaciones()
-                if df_eva.empty:
-                    st.info("No hay registros en Evaluaciones_CA.")
-                else:
-                    st.dataframe(df_eva, use_container_width=True)
-
-            with tabs[1]:
-                df_auto = leer_autorizaciones()
-                if df_auto.empty:
-                    st.info("No hay registros en Autorizaciones_CA.")
-                else:
-                    st.dataframe(df_auto, use_container_width=True)
-
-        except Exception as e:
-            st.error(f"No se pudo leer las tablas de Google Sheets: {e}")
+        # El expander corre aunque esté cerrado: las hojas se leen solo si se
+        # marca la casilla (y luego salen del caché hasta "Forzar recarga").
+        if st.checkbox("Cargar tablas", key="ver_tablas_bd"):
+            if st.button("🔄 Forzar recarga", key="recargar_tablas_bd"):
+                limpiar_cache_lecturas()
+            try:
+                df_eva, df_auto = leer_eva_y_auto()
+                tabs = st.tabs(["Evaluaciones_CA", "Autorizaciones_CA"])
+
+                with tabs[0]:
+                    if df_eva.empty:
+                        st.info("No hay registros en Evaluaciones_CA.")
+                    else:
+                        st.dataframe(df_eva, use_container_width=True)
+
+                with tabs[1]:
+                    if df_auto.empty:
+                        st.info("No hay registros en Autorizaciones_CA.")
+                    else:
+                        st.dataframe(df_auto, use_container_width=True)
+
+            except Exception as e:
+                st.error(f"No se pudo leer las tablas de Google Sheets: {e}")
 
     st.markdown("</div>", unsafe_allow_html=True)
 
@@ -11,12 +11,17 @@ Manejo de Google Sheets para Comercio Ambulatorio:
 
 from __future__ import annotations
 
-from typing import List, Dict
+from typing import TYPE_CHECKING, List, Dict, Tuple
 
-import gspread
-import pandas as pd
 import streamlit as st
-from google.oauth2.service_account import Credentials
+
+from utils import tamano_grilla
+
+# gspread, google-auth y pandas se importan dentro de las funciones que los
+# usan: cargar la página no paga su importación hasta la primera lectura.
+if TYPE_CHECKING:
+    import gspread
+    import pandas as pd
 
 # ---------------------------------------------------------------------------
 # CONFIG BÁSICA
@@ -106,33 +111,63 @@ def _get_client() -> gspread.Client:
     """
     Crea el cliente de Google Sheets usando st.secrets["gcp_service_account"].
     """
+    import gspread
+    from google.oauth2.service_account import Credentials
+
     creds_info = st.secrets["gcp_service_account"]
     creds = Credentials.from_service_account_info(creds_info, scopes=SCOPES)
     client = gspread.authorize(creds)
     return client
 
 
+@st.cache_resource(show_spinner=False)
 def _get_spreadsheet():
     client = _get_client()
     return client.open_by_key(SPREADSHEET_ID_COMERCIO)
 
 
-def _get_worksheet(sheet_name: str, columnas: List[str]) -> gspread.Worksheet:
+@st.cache_resource(show_spinner=False)
+def _ws_handle(sheet_name: str, columnas: tuple) -> Tuple[gspread.Worksheet, List[str]]:
     """
-    Devuelve la worksheet indicada. Si no existe, la crea.
-    Si está vacía, escribe la fila de encabezados.
+    Worksheet cacheada por proceso y su encabezado (fila 1): se abre (o crea)
+    y se revisa una sola vez, no en cada lectura/escritura.
+    Las columnas esperadas que falten en el encabezado se agregan al final.
     """
+    from gspread.exceptions import WorksheetNotFound
+
     sh = _get_spreadsheet()
     try:
         ws = sh.worksheet(sheet_name)
-    except gspread.exceptions.WorksheetNotFound:
+    except WorksheetNotFound:
         ws = sh.add_worksheet(title=sheet_name, rows=1000, cols=len(columnas) + 2)
 
-    values = ws.get_all_values()
-    if not values:
-        ws.update("A1", [columnas])
+    # Solo la fila 1: las escrituras ubican cada columna por su nombre
+    encabezado = ws.row_values(1)
+    faltantes = [col for col in columnas if col not in encabezado]
+    if faltantes:
+        ancho = len(encabezado) + len(faltantes)
+        if ancho > ws.col_count:
+            ws.add_cols(ancho - ws.col_count)
+        ws.update(values=[faltantes], range_name=f"{_letra_indice(len(encabezado) + 1)}1")
+        encabezado = encabezado + faltantes
+
+    return ws, encabezado
+
+
+def _get_worksheet(sheet_name: str, columnas: List[str]) -> gspread.Worksheet:
+    """
+    Devuelve la worksheet indicada. Si no existe, la crea.
+    Si le faltan encabezados, los agrega.
+    """
+    return _ws_handle(sheet_name, tuple(columnas))[0]
 
-    return ws
+
+def _encabezado(sheet_name: str, columnas: List[str]) -> List[str]:
+    """
+    Encabezado real de la hoja (puede tener otro orden o columnas extra).
+    Es la lista cacheada: _escribir_df la actualiza al reescribir la hoja.
+    """
+    return _ws_handle(sheet_name, tuple(columnas))[1]
 
 
 # ---------------------------------------------------------------------------
@@ -140,16 +175,67 @@ def _get_worksheet(sheet_name: str, columnas: List[str]) -> gspread.Worksheet:
 # ---------------------------------------------------------------------------
 
 
-def _leer_df(sheet_name: str, columnas: List[str]) -> pd.DataFrame:
+@st.cache_data(ttl=30, show_spinner=False)
+def _leer_df_cached(sheet_name: str, columnas: tuple) -> pd.DataFrame:
+    """
+    Hoja completa como DataFrame, cacheada 30 s. Toda escritura de este módulo
+    llama a limpiar_cache_lecturas() para no servir datos viejos.
+    """
+    import pandas as pd
+
+    columnas = list(columnas)
     ws = _get_worksheet(sheet_name, columnas)
     values = ws.get_all_values()
 
     if not values:
         return pd.DataFrame(columns=columnas)
 
-    header = values[0]
-    filas = values[1:]
+    return _df_desde_valores(values[0], values[1:], columnas)
 
+
+def _leer_df(sheet_name: str, columnas: List[str]) -> pd.DataFrame:
+    return _leer_df_cached(sheet_name, tuple(columnas))
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _leer_varios_df_cached(hojas: tuple) -> tuple:
+    """
+    Varias hojas completas con una sola petición (values_batch_get).
+    `hojas` = ((sheet_name, columnas_tuple), ...); devuelve los DataFrames
+    en el mismo orden.
+    """
+    import pandas as pd
+
+    for sheet_name, columnas in hojas:
+        _get_worksheet(sheet_name, list(columnas))  # crea la hoja si falta
+
+    resp = _get_spreadsheet().values_batch_get([f"'{nombre}'" for nombre, _ in hojas])
+
+    dfs = []
+    for (_, columnas), rango in zip(hojas, resp.get("valueRanges", [])):
+        columnas = list(columnas)
+        values = rango.get("values", [])
+        if not values:
+            dfs.append(pd.DataFrame(columns=columnas))
+        else:
+            dfs.append(_df_desde_valores(values[0], values[1:], columnas))
+    return tuple(dfs)
+
+
+def limpiar_cache_lecturas() -> None:
+    """Descarta las lecturas cacheadas (tras escribir o al pedir 'Refrescar')."""
+    _leer_df_cached.clear()
+    _leer_varios_df_cached.clear()
+    _leer_documentos_tail_cached.clear()
+
+
+def _df_desde_valores(header: List[str], filas: List[List[str]], columnas: List[str]) -> pd.DataFrame:
+    """DataFrame con exactamente `columnas` a partir del encabezado y filas leídos."""
+    import pandas as pd
+
+    # Las lecturas por rango no rellenan las celdas vacías del final de cada fila
+    ancho = len(header)
+    filas = [f[:ancho] + [""] * (ancho - len(f)) for f in filas]
     df = pd.DataFrame(filas, columns=header)
 
     # Asegura que existan todas las columnas esperadas
@@ -161,44 +247,161 @@ def _leer_df(sheet_name: str, columnas: List[str]) -> pd.DataFrame:
     return df
 
 
+def _celdas_vacias(df: pd.DataFrame, columna: str) -> pd.Series:
+    """
+    True donde la celda está vacía (o solo espacios). Sin astype(str): lo leído
+    de la hoja ya es texto, y lo que no lo sea (NaN, números) cuenta como lleno.
+    """
+    return df[columna].str.strip().eq("")
+
+
 def _escribir_df(sheet_name: str, columnas: List[str], df: pd.DataFrame) -> None:
+    import pandas as pd
+
     ws = _get_worksheet(sheet_name, columnas)
 
-    df = df.copy()
-    for col in columnas:
-        if col not in df.columns:
-            df[col] = ""
-    df = df[columnas].fillna("")
+    # Columnas faltantes quedan vacías; sin copiar el DataFrame ni pasar por
+    # astype(str), que armaba otro DataFrame completo solo para aplanarlo.
+    faltantes = [col for col in columnas if col not in df.columns]
+    if faltantes:
+        df = df.assign(**{col: "" for col in faltantes})
 
-    values = [df.columns.tolist()] + df.astype(str).values.tolist()
+    values = [list(columnas)]
+    values.extend(
+        [v if type(v) is str else ("" if pd.isna(v) else str(v)) for v in fila]
+        for fila in df[columnas].itertuples(index=False, name=None)
+    )
 
-    ws.clear()
-    ws.update("A1", values)
+    # Una sola llamada: borra los valores de toda la hoja (como ws.clear(), el
+    # formato queda), agranda la grilla si hace falta (updateCells no agrega
+    # filas ni columnas, a diferencia de update()) y escribe desde A1.
+    filas, cols = tamano_grilla(ws)
+    requests = [{"updateCells": {"range": {"sheetId": ws.id}, "fields": "userEnteredValue"}}]
+    if len(values) > filas:
+        requests.append(
+            {"appendDimension": {"sheetId": ws.id, "dimension": "ROWS", "length": len(values) - filas}}
+        )
+    if len(columnas) > cols:
+        requests.append(
+            {"appendDimension": {"sheetId": ws.id, "dimension": "COLUMNS", "length": len(columnas) - cols}}
+        )
+    requests.append(
+        {
+            "updateCells": {
+                "start": {"sheetId": ws.id, "rowIndex": 0, "columnIndex": 0},
+                "rows": [{"values": [_celda(v) for v in fila]} for fila in values],
+                "fields": "userEnteredValue",
+            }
+        }
+    )
+    _get_spreadsheet().batch_update({"requests": requests})
+    # La hoja quedó con el encabezado en el orden de `columnas`
+    _encabezado(sheet_name, columnas)[:] = columnas
+    limpiar_cache_lecturas()
 
 
-def _append_fila(
+def _append_filas(
     sheet_name: str,
     columnas: List[str],
-    fila: Dict[str, str],
+    filas: List[Dict[str, str]],
     auto_numero_col: str | None = None,
 ) -> None:
     """
-    Agrega una nueva fila:
-    - 'fila' es un dict {columna: valor}
+    Agrega varias filas al final de la hoja con una sola llamada append_rows
+    (las filas se juntan en una lista; la hoja no se lee ni se reescribe):
+    - cada fila es un dict {columna: valor}; columnas desconocidas se ignoran
+    - los valores van en el orden del encabezado real de la hoja
     - si auto_numero_col no es None, se rellena con correlativo (1,2,3,...)
     """
-    df = _leer_df(sheet_name, columnas)
+    if not filas:
+        return
+
+    ws = _get_worksheet(sheet_name, columnas)
+    encabezado = _encabezado(sheet_name, columnas)
+
+    idx_num = None
+    if auto_numero_col and auto_numero_col in encabezado:
+        idx_num = encabezado.index(auto_numero_col)
+        # Solo la columna del correlativo: encabezado + registros = siguiente N°
+        siguiente = len(ws.col_values(idx_num + 1))
+
+    valores = []
+    for fila in filas:
+        nueva = [fila.get(col, "") for col in encabezado]
+        if idx_num is not None:
+            nueva[idx_num] = siguiente
+            siguiente += 1
+        valores.append(nueva)
+
+    ws.append_rows(
+        valores,
+        value_input_option="RAW",
+        insert_data_option="INSERT_ROWS",
+        table_range="A1",
+    )
+    limpiar_cache_lecturas()
+
+
+def _append_fila(
+    sheet_name: str,
+    columnas: List[str],
+    fila: Dict[str, str],
+    auto_numero_col: str | None = None,
+) -> None:
+    """Agrega una nueva fila (ver _append_filas)."""
+    _append_filas(sheet_name, columnas, [fila], auto_numero_col)
+
 
-    nueva = {col: "" for col in columnas}
-    for col, val in fila.items():
-        if col in nueva:
-            nueva[col] = val
+def _letra_indice(n: int) -> str:
+    """Letra(s) de la columna n (1 = A)."""
+    from gspread.utils import rowcol_to_a1
 
-    if auto_numero_col and auto_numero_col in nueva:
-        nueva[auto_numero_col] = len(df) + 1
+    return rowcol_to_a1(1, n).rstrip("0123456789")
 
-    df = pd.concat([df, pd.DataFrame([nueva])], ignore_index=True)
-    _escribir_df(sheet_name, columnas, df)
+
+def _letra_columna(encabezado: List[str], columna: str) -> str:
+    return _letra_indice(encabezado.index(columna) + 1)
+
+
+def _filas_donde(
+    ws: gspread.Worksheet,
+    encabezado: List[str],
+    columna: str,
+    valor: str,
+    strip: bool = False,
+) -> List[int]:
+    """
+    Números de fila (1 = encabezado) cuyo valor en `columna` coincide con
+    `valor`. Lee solo esa columna.
+    """
+    buscado = str(valor).strip() if strip else str(valor)
+    celdas = ws.col_values(encabezado.index(columna) + 1)
+    return [
+        i
+        for i, v in enumerate(celdas[1:], start=2)
+        if (v.strip() if strip else v) == buscado
+    ]
+
+
+def _actualizar_celdas(
+    ws: gspread.Worksheet,
+    encabezado: List[str],
+    filas: List[int],
+    cambios: Dict[str, str],
+) -> None:
+    """Escribe solo las celdas de `cambios` en las filas indicadas (una llamada)."""
+    if not filas:
+        return
+    letras = {col: _letra_columna(encabezado, col) for col in cambios}
+    ws.batch_update(
+        [
+            {"range": f"{letras[col]}{fila}", "values": [[val]]}
+            for fila in filas
+            for col, val in cambios.items()
+        ],
+        value_input_option="RAW",
+    )
+    limpiar_cache_lecturas()
 
 
 # ---------------------------------------------------------------------------
@@ -214,7 +417,7 @@ def escribir_evaluaciones(df: pd.DataFrame) -> None:
     _escribir_df(EVAL_SHEET_NAME, COLUMNAS_EVALUACION, df)
 
 
-def append_evaluacion(
+def _fila_evaluacion(
     *,
     num_ds: str,
     nombre_completo: str,
@@ -224,12 +427,9 @@ def append_evaluacion(
     fecha_resolucion: str = "",
     num_autorizacion: str = "",
     fecha_autorizacion: str = "",
-) -> None:
-    """
-    Agrega una fila a Evaluaciones_CA.
-    Todas las fechas deben venir ya como string (ej. '16/01/2026').
-    """
-    fila = {
+) -> Dict[str, str]:
+    """Fila {columna: valor} de Evaluaciones_CA (sin el correlativo N°)."""
+    return {
         "NUMERO DE DOCUMENTO SIMPLE": num_ds,
         "NOMBRES Y APELLIDOS": nombre_completo,
         "N° DE EVALUACIÓN": cod_evaluacion,
@@ -240,10 +440,35 @@ def append_evaluacion(
         "FECHA DE AUTORIZACION": fecha_autorizacion,
     }
 
+
+def append_evaluacion(
+    *,
+    num_ds: str,
+    nombre_completo: str,
+    cod_evaluacion: str,
+    fecha_eval: str,
+    cod_resolucion: str = "",
+    fecha_resolucion: str = "",
+    num_autorizacion: str = "",
+    fecha_autorizacion: str = "",
+) -> None:
+    """
+    Agrega una fila a Evaluaciones_CA.
+    Todas las fechas deben venir ya como string (ej. '16/01/2026').
+    """
     _append_fila(
         EVAL_SHEET_NAME,
         COLUMNAS_EVALUACION,
-        fila,
+        _fila_evaluacion(
+            num_ds=num_ds,
+            nombre_completo=nombre_completo,
+            cod_evaluacion=cod_evaluacion,
+            fecha_eval=fecha_eval,
+            cod_resolucion=cod_resolucion,
+            fecha_resolucion=fecha_resolucion,
+            num_autorizacion=num_autorizacion,
+            fecha_autorizacion=fecha_autorizacion,
+        ),
         auto_numero_col="N°",
     )
 
@@ -257,22 +482,23 @@ def actualizar_evaluacion_con_resolucion(
     fecha_autorizacion: str,
 ) -> None:
     """
-    Actualiza la fila de Evaluaciones_CA correspondiente al N° de Evaluación.
+    Actualiza la fila de Evaluaciones_CA correspondiente al N° de Evaluación
+    (solo las celdas que cambian).
     """
-    df = leer_evaluaciones()
-    if df.empty:
-        return
-
-    mask = df["N° DE EVALUACIÓN"].astype(str) == str(cod_evaluacion)
-    if not mask.any():
-        return
-
-    df.loc[mask, "N° DE RESOLUCIÓN"] = cod_resolucion
-    df.loc[mask, "FECHA DE RESOLUCIÓN"] = fecha_resolucion
-    df.loc[mask, "N° DE AUTORIZACIÓN"] = num_autorizacion
-    df.loc[mask, "FECHA DE AUTORIZACION"] = fecha_autorizacion
-
-    escribir_evaluaciones(df)
+    ws = _get_worksheet(EVAL_SHEET_NAME, COLUMNAS_EVALUACION)
+    encabezado = _encabezado(EVAL_SHEET_NAME, COLUMNAS_EVALUACION)
+    filas = _filas_donde(ws, encabezado, "N° DE EVALUACIÓN", cod_evaluacion)
+    _actualizar_celdas(
+        ws,
+        encabezado,
+        filas,
+        {
+            "N° DE RESOLUCIÓN": cod_resolucion,
+            "FECHA DE RESOLUCIÓN": fecha_resolucion,
+            "N° DE AUTORIZACIÓN": num_autorizacion,
+            "FECHA DE AUTORIZACION": fecha_autorizacion,
+        },
+    )
 
 
 def evaluaciones_sin_resolucion() -> pd.DataFrame:
@@ -283,8 +509,7 @@ def evaluaciones_sin_resolucion() -> pd.DataFrame:
     if df.empty:
         return df
 
-    mask = df["N° DE RESOLUCIÓN"].astype(str).str.strip() == ""
-    return df[mask].copy()
+    return df[_celdas_vacias(df, "N° DE RESOLUCIÓN")].copy()
 
 
 # ---------------------------------------------------------------------------
@@ -296,11 +521,21 @@ def leer_autorizaciones() -> pd.DataFrame:
     return _leer_df(AUTO_SHEET_NAME, COLUMNAS_AUTORIZACION)
 
 
+def leer_eva_y_auto() -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Evaluaciones_CA y Autorizaciones_CA leídas en una sola petición."""
+    return _leer_varios_df_cached(
+        (
+            (EVAL_SHEET_NAME, tuple(COLUMNAS_EVALUACION)),
+            (AUTO_SHEET_NAME, tuple(COLUMNAS_AUTORIZACION)),
+        )
+    )
+
+
 def escribir_autorizaciones(df: pd.DataFrame) -> None:
     _escribir_df(AUTO_SHEET_NAME, COLUMNAS_AUTORIZACION, df)
 
 
-def append_autorizacion(
+def _fila_autorizacion(
     *,
     fecha_ingreso: str,
     ds: str,
@@ -326,14 +561,9 @@ def append_autorizacion(
     telefono: str = "",
     tiempo: str = "",
     plazo: str = "",
-) -> None:
-    """
-    Agrega una fila a Autorizaciones_CA.
-
-    Todos los campos se mandan ya como string formateado
-    (fechas tipo '16/01/2026', etc.).
-    """
-    fila = {
+) -> Dict[str, str]:
+    """Fila {columna: valor} de Autorizaciones_CA."""
+    return {
         "FECHA DE INGRESO": fecha_ingreso,
         "D.S": ds,
         "NOMBRE Y APELLIDO": nombre,
@@ -360,10 +590,19 @@ def append_autorizacion(
         "PLAZO": plazo,
     }
 
+
+def append_autorizacion(**datos: str) -> None:
+    """
+    Agrega una fila a Autorizaciones_CA.
+    Recibe los mismos argumentos (por nombre) que _fila_autorizacion.
+
+    Todos los campos se mandan ya como string formateado
+    (fechas tipo '16/01/2026', etc.).
+    """
     _append_fila(
         AUTO_SHEET_NAME,
         COLUMNAS_AUTORIZACION,
-        fila,
+        _fila_autorizacion(**datos),
         auto_numero_col=None,  # aquí no hay columna "N°"
     )
 
@@ -382,30 +621,26 @@ def actualizar_autorizacion_resolucion_y_cert(
 ) -> None:
     """
     Completa/actualiza en Autorizaciones_CA los datos de resolución y certificado
-    para una evaluación ya registrada.
+    para una evaluación ya registrada (solo las celdas que cambian).
     """
-    df = leer_autorizaciones()
-    if df.empty:
-        return
-
-    mask = df["N° DE EVALUACION"].astype(str) == str(num_eval)
-    if not mask.any():
-        return
-
-    df.loc[mask, "CERTIFICADO ANTERIOR"] = certificado_anterior
-    df.loc[mask, "FECHA EMITIDA CERTIFICADO ANTERIOR"] = (
-        fecha_emitida_cert_anterior
-    )
-    df.loc[mask, "FECHA DE CADUCIDAD CERTIFICADO ANTERIOR"] = (
-        fecha_caducidad_cert_anterior
+    ws = _get_worksheet(AUTO_SHEET_NAME, COLUMNAS_AUTORIZACION)
+    encabezado = _encabezado(AUTO_SHEET_NAME, COLUMNAS_AUTORIZACION)
+    filas = _filas_donde(ws, encabezado, "N° DE EVALUACION", num_eval)
+    _actualizar_celdas(
+        ws,
+        encabezado,
+        filas,
+        {
+            "CERTIFICADO ANTERIOR": certificado_anterior,
+            "FECHA EMITIDA CERTIFICADO ANTERIOR": fecha_emitida_cert_anterior,
+            "FECHA DE CADUCIDAD CERTIFICADO ANTERIOR": fecha_caducidad_cert_anterior,
+            "N° DE RESOLUCIÓN": num_resolucion,
+            "FECHA RESOLUCIÓN": fecha_resolucion,
+            "N° DE CERTIFICADO": num_certificado,
+            "FECHA EMITIDA CERTIFICADO": fecha_emitida_cert,
+            "VIGENCIA DE AUTORIZACIÓN": vigencia_autorizacion,
+        },
     )
-    df.loc[mask, "N° DE RESOLUCIÓN"] = num_resolucion
-    df.loc[mask, "FECHA RESOLUCIÓN"] = fecha_resolucion
-    df.loc[mask, "N° DE CERTIFICADO"] = num_certificado
-    df.loc[mask, "FECHA EMITIDA CERTIFICADO"] = fecha_emitida_cert
-    df.loc[mask, "VIGENCIA DE AUTORIZACIÓN"] = vigencia_autorizacion
-
-    escribir_autorizaciones(df)
 
 
 def autorizaciones_pendientes_resolucion() -> pd.DataFrame:
@@ -416,8 +651,7 @@ def autorizaciones_pendientes_resolucion() -> pd.DataFrame:
     if df.empty:
         return df
 
-    mask = df["N° DE RESOLUCIÓN"].astype(str).str.strip() == ""
-    return df[mask].copy()
+    return df[_celdas_vacias(df, "N° DE RESOLUCIÓN")].copy()
 
 
 # ---------------------------------------------------------------------------
@@ -429,11 +663,40 @@ def leer_documentos() -> pd.DataFrame:
     return _leer_df(DOCS_SHEET_NAME, COLUMNAS_DOCUMENTOS)
 
 
+def leer_documentos_tail(n: int = 50) -> pd.DataFrame:
+    """
+    Últimos `n` Documentos Simples, sin descargar toda la hoja:
+    una lectura de la columna N° DE DOCUMENTO SIMPLE (siempre llena) para saber
+    dónde termina la tabla y una sola petición con encabezado + últimas filas.
+    Cacheada 30 s como las demás lecturas (se limpia al escribir).
+    """
+    return _leer_documentos_tail_cached(n)
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _leer_documentos_tail_cached(n: int) -> pd.DataFrame:
+    import pandas as pd
+
+    ws = _get_worksheet(DOCS_SHEET_NAME, COLUMNAS_DOCUMENTOS)
+    col_ds = _encabezado(DOCS_SHEET_NAME, COLUMNAS_DOCUMENTOS).index("N° DE DOCUMENTO SIMPLE") + 1
+    ultima = len(ws.col_values(col_ds))
+    if ultima < 2:
+        return pd.DataFrame(columns=COLUMNAS_DOCUMENTOS)
+
+    primera = max(2, ultima - n + 1)
+    ultima_col = _letra_indice(ws.col_count)
+    header, filas = ws.batch_get([f"A1:{ultima_col}1", f"A{primera}:{ultima_col}{ultima}"])
+
+    if not header:
+        return pd.DataFrame(columns=COLUMNAS_DOCUMENTOS)
+    return _df_desde_valores(header[0], [list(f) for f in filas], COLUMNAS_DOCUMENTOS)
+
+
 def escribir_documentos(df: pd.DataFrame) -> None:
     _escribir_df(DOCS_SHEET_NAME, COLUMNAS_DOCUMENTOS, df)
 
 
-def append_documento(
+def _fila_documento(
     *,
     fecha_ingreso: str,
     num_documento_simple: str,
@@ -450,11 +713,9 @@ def append_documento(
     fecha_notificacion: str = "",
     folios: str = "",
     estado: str = "PENDIENTE",
-) -> None:
-    """
-    Registra un nuevo Documento Simple en Documentos_CA.
-    """
-    fila = {
+) -> Dict[str, str]:
+    """Fila {columna: valor} de Documentos_CA (sin el correlativo N°)."""
+    return {
         "ESTADO": estado,
         "FECHA DE INGRESO": fecha_ingreso,
         "N° DE DOCUMENTO SIMPLE": num_documento_simple,
@@ -472,10 +733,30 @@ def append_documento(
         "FOLIOS": folios,
     }
 
+
+def append_documento(**datos: str) -> None:
+    """
+    Registra un nuevo Documento Simple en Documentos_CA.
+    Recibe los mismos argumentos (por nombre) que _fila_documento.
+    """
     _append_fila(
         DOCS_SHEET_NAME,
         COLUMNAS_DOCUMENTOS,
-        fila,
+        _fila_documento(**datos),
+        auto_numero_col="N°",
+    )
+
+
+def append_documentos_batch(documentos: List[Dict[str, str]]) -> None:
+    """
+    Registra varios Documentos Simples con una sola escritura (append_rows).
+    Cada elemento son los argumentos de append_documento. El correlativo N°
+    continúa desde el número de filas que ya tiene la hoja.
+    """
+    _append_filas(
+        DOCS_SHEET_NAME,
+        COLUMNAS_DOCUMENTOS,
+        [_fila_documento(**datos) for datos in documentos],
         auto_numero_col="N°",
     )
 
@@ -483,20 +764,20 @@ def append_documento(
 def actualizar_estado_documento(num_documento_simple: str, nuevo_estado: str) -> None:
     """
     Cambia el ESTADO de un documento simple (por N° de Documento Simple).
+    Solo se escribe la celda ESTADO de las filas que coinciden.
     """
-    df = leer_documentos()
-    if df.empty:
-        return
-
-    mask = (
-        df["N° DE DOCUMENTO SIMPLE"].astype(str).str.strip()
-        == str(num_documento_simple).strip()
+    ws = _get_worksheet(DOCS_SHEET_NAME, COLUMNAS_DOCUMENTOS)
+    encabezado = _encabezado(DOCS_SHEET_NAME, COLUMNAS_DOCUMENTOS)
+    filas = _filas_donde(
+        ws, encabezado, "N° DE DOCUMENTO SIMPLE", num_documento_simple, strip=True
+    )
+    _actualizar_celdas(
+        ws, encabezado, filas, {"ESTADO": str(nuevo_estado).upper()}
     )
-    if not mask.any():
-        return
 
-    df.loc[mask, "ESTADO"] = str(nuevo_estado).upper()
-    escribir_documentos(df)
+
+_ASUNTOS_EVALUACION = ("RENOVACION", "SOLICITUD DE COMERCIO AMBULATORIO")
+_ESTADOS_EVALUACION = ("PENDIENTE", "EN EVALUACION")
 
 
 def documentos_para_evaluacion() -> pd.DataFrame:
@@ -511,18 +792,109 @@ def documentos_para_evaluacion() -> pd.DataFrame:
     if df.empty:
         return df
 
-    asuntos_validos = {"RENOVACION", "SOLICITUD DE COMERCIO AMBULATORIO"}
-
-    df["ASUNTO_UP"] = df["ASUNTO"].str.upper().str.strip()
-    df["PROC_UP"] = df["PROCEDENTE / IMPROCEDENTE"].str.upper().str.strip()
-    df["ESTADO_UP"] = df["ESTADO"].str.upper().str.strip()
-
+    # Máscara directa sobre las columnas normalizadas: sin columnas auxiliares
+    # en df que luego haya que borrar
     mask = (
-        df["ASUNTO_UP"].isin(asuntos_validos)
-        & (df["PROC_UP"] == "PROCEDENTE")
-        & df["ESTADO_UP"].isin({"PENDIENTE", "EN EVALUACION"})
+        df["ASUNTO"].str.upper().str.strip().isin(_ASUNTOS_EVALUACION)
+        & (df["PROCEDENTE / IMPROCEDENTE"].str.upper().str.strip() == "PROCEDENTE")
+        & df["ESTADO"].str.upper().str.strip().isin(_ESTADOS_EVALUACION)
     )
+    return df.loc[mask].copy()
+
+
+# ---------------------------------------------------------------------------
+# API – GUARDADO CONJUNTO (Evaluación + Autorización + estado del D.S.)
+# ---------------------------------------------------------------------------
+
 
-    out = df[mask].copy()
-    out.drop(columns=["ASUNTO_UP", "PROC_UP", "ESTADO_UP"], inplace=True)
-    return out
+def _celda(valor) -> Dict:
+    """CellData para batch_update (equivale a value_input_option='RAW')."""
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return {"userEnteredValue": {"numberValue": valor}}
+    return {"userEnteredValue": {"stringValue": "" if valor is None else str(valor)}}
+
+
+def _fila_celdas(fila: Dict, encabezado: List[str]) -> Dict:
+    return {"values": [_celda(fila.get(col, "")) for col in encabezado]}
+
+
+def _rango_columna(sheet_name: str, encabezado: List[str], columna: str) -> str:
+    letra = _letra_columna(encabezado, columna)
+    return f"'{sheet_name}'!{letra}:{letra}"
+
+
+def guardar_todo_bd(
+    evaluacion: Dict[str, str],
+    autorizacion: Dict[str, str],
+    num_documento_simple: str = "",
+    nuevo_estado: str = "AUTORIZADO",
+) -> None:
+    """
+    Guarda de una vez la fila de Evaluaciones_CA, la de Autorizaciones_CA y,
+    si se indica N° de D.S., el nuevo ESTADO en Documentos_CA.
+
+    - `evaluacion` / `autorizacion`: argumentos (por nombre) de
+      append_evaluacion / append_autorizacion.
+    - Una lectura (values_batch_get: columna N° de Evaluaciones y columna
+      N° DE DOCUMENTO SIMPLE de Documentos) y una sola escritura
+      (batch_update con appendCells + updateCells) para las tres hojas.
+    """
+    sh = _get_spreadsheet()
+    ws_eval = _get_worksheet(EVAL_SHEET_NAME, COLUMNAS_EVALUACION)
+    ws_auto = _get_worksheet(AUTO_SHEET_NAME, COLUMNAS_AUTORIZACION)
+    enc_eval = _encabezado(EVAL_SHEET_NAME, COLUMNAS_EVALUACION)
+    enc_auto = _encabezado(AUTO_SHEET_NAME, COLUMNAS_AUTORIZACION)
+
+    rangos = [_rango_columna(EVAL_SHEET_NAME, enc_eval, "N°")]
+    num_ds = str(num_documento_simple or "").strip()
+    if num_ds:
+        ws_docs = _get_worksheet(DOCS_SHEET_NAME, COLUMNAS_DOCUMENTOS)
+        enc_docs = _encabezado(DOCS_SHEET_NAME, COLUMNAS_DOCUMENTOS)
+        rangos.append(_rango_columna(DOCS_SHEET_NAME, enc_docs, "N° DE DOCUMENTO SIMPLE"))
+
+    leidos = sh.values_batch_get(rangos, params={"majorDimension": "COLUMNS"})
+    columnas_leidas = [
+        (vr.get("values") or [[]])[0] for vr in leidos.get("valueRanges", [])
+    ]
+
+    fila_eval = _fila_evaluacion(**evaluacion)
+    # Columna N° con encabezado: su largo es el siguiente correlativo
+    fila_eval["N°"] = len(columnas_leidas[0])
+
+    requests = [
+        {
+            "appendCells": {
+                "sheetId": ws_eval.id,
+                "rows": [_fila_celdas(fila_eval, enc_eval)],
+                "fields": "userEnteredValue",
+            }
+        },
+        {
+            "appendCells": {
+                "sheetId": ws_auto.id,
+                "rows": [_fila_celdas(_fila_autorizacion(**autorizacion), enc_auto)],
+                "fields": "userEnteredValue",
+            }
+        },
+    ]
+
+    if num_ds:
+        col_estado = enc_docs.index("ESTADO")
+        for fila_idx, valor in enumerate(columnas_leidas[1]):
+            if fila_idx and str(valor).strip() == num_ds:
+                requests.append(
+                    {
+                        "updateCells": {
+                            "start": {
+                                "sheetId": ws_docs.id,
+                                "rowIndex": fila_idx,
+                                "columnIndex": col_estado,
+                            },
+                            "rows": [{"values": [_celda(str(nuevo_estado).upper())]}],
+                            "fields": "userEnteredValue",
+                        }
+                    }
+                )
+
+    sh.batch_update({"requests": requests})
+    limpiar_cache_lecturas()
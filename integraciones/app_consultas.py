@@ -1,17 +1,80 @@
 # integraciones/app_consultas.py
-import json
+import html
+from string import Template
+
 import streamlit as st
 
 from integraciones.codart import (
     CodartAPIError,
+    _json_dumps_legible,
     consultar_dni,
     consultar_ruc,
     dni_a_nombre_completo,
 )
 
+# Valores que se muestran como "-" (CODART devuelve "Locked" en campos ocultos)
+_VACIOS = frozenset({"", "Locked"})
+
 def _val(v):
-    v = (v or "").strip() if isinstance(v, str) else v
-    return "-" if (v in [None, "", "Locked"]) else v
+    if v is None:
+        return "-"
+    if type(v) is str:
+        v = v.strip()
+        if v in _VACIOS:
+            return "-"
+    return v
+
+def _html(v) -> str:
+    """Valor de la API listo para insertar en HTML (escapado)."""
+    return html.escape(str(_val(v)), quote=True)
+
+_CARD_DNI = Template("""
+                    <div style="padding:14px;border:1px solid rgba(255,255,255,.12);border-radius:12px;">
+                      <div style="font-size:14px;opacity:.8;">Nombre completo</div>
+                      <div style="font-size:20px;font-weight:700;margin-top:4px;">$nombre</div>
+                      <div style="margin-top:10px;opacity:.9;">
+                        <b>DNI:</b> $dni &nbsp;&nbsp; | &nbsp;&nbsp;
+                        <b>Nacionalidad:</b> $nacionalidad
+                      </div>
+                    </div>
+                    """)
+
+_CARD_RUC = Template("""
+                    <div style="padding:14px;border:1px solid rgba(255,255,255,.12);border-radius:12px;">
+                      <div style="font-size:14px;opacity:.8;">Razón social</div>
+                      <div style="font-size:20px;font-weight:700;margin-top:4px;">$razon</div>
+                      <div style="margin-top:10px;opacity:.9;">
+                        <b>RUC:</b> $ruc<br/>
+                        <b>Dirección:</b> $direccion<br/>
+                        <b>Estado / Condición:</b> $estado / $condicion
+                      </div>
+                    </div>
+                    """)
+
+# Tarjetas HTML y JSON cacheados por respuesta: volver a ver el mismo DNI/RUC
+# no rearma las tarjetas ni re-serializa el JSON. Los valores de la API se
+# escapan (se muestran con unsafe_allow_html).
+@st.cache_data(max_entries=256, show_spinner=False)
+def _card_dni(res: dict) -> str:
+    return _CARD_DNI.substitute(
+        nombre=_html(dni_a_nombre_completo(res)),
+        dni=_html(res.get("document_number")),
+        nacionalidad=_html(res.get("nationality")),
+    )
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _card_ruc(res: dict, ruc: str) -> str:
+    return _CARD_RUC.substitute(
+        razon=_html(res.get("razon_social")),
+        ruc=_html(res.get("ruc") or ruc),
+        direccion=_html(res.get("direccion")),
+        estado=_html(res.get("estado")),
+        condicion=_html(res.get("condicion")),
+    )
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _json_legible(res) -> str:
+    return _json_dumps_legible(res)
 
 def run_modulo_consultas():
     st.title("📄 Consultas (DNI / RUC)")
@@ -31,27 +94,14 @@ def run_modulo_consultas():
         if btn:
             try:
                 res = consultar_dni(dni)
-                nombre = dni_a_nombre_completo(res)
 
                 st.success("Consulta DNI OK")
 
                 st.markdown("### Resultado")
-                st.markdown(
-                    f"""
-                    <div style="padding:14px;border:1px solid rgba(255,255,255,.12);border-radius:12px;">
-                      <div style="font-size:14px;opacity:.8;">Nombre completo</div>
-                      <div style="font-size:20px;font-weight:700;margin-top:4px;">{_val(nombre)}</div>
-                      <div style="margin-top:10px;opacity:.9;">
-                        <b>DNI:</b> {_val(res.get("document_number"))} &nbsp;&nbsp; | &nbsp;&nbsp;
-                        <b>Nacionalidad:</b> {_val(res.get("nationality"))}
-                      </div>
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
+                st.markdown(_card_dni(res), unsafe_allow_html=True)
 
                 with st.expander("Ver respuesta técnica (JSON)"):
-                    st.code(json.dumps(res, indent=2, ensure_ascii=False), language="json")
+                    st.code(_json_legible(res), language="json")
 
             except ValueError as e:
                 st.error(str(e))
@@ -76,29 +126,11 @@ def run_modulo_consultas():
 
                 st.success("Consulta RUC OK")
 
-                razon = _val(res.get("razon_social"))
-                direccion = _val(res.get("direccion"))
-                estado = _val(res.get("estado"))
-                condicion = _val(res.get("condicion"))
-
                 st.markdown("### Resultado")
-                st.markdown(
-                    f"""
-                    <div style="padding:14px;border:1px solid rgba(255,255,255,.12);border-radius:12px;">
-                      <div style="font-size:14px;opacity:.8;">Razón social</div>
-                      <div style="font-size:20px;font-weight:700;margin-top:4px;">{razon}</div>
-                      <div style="margin-top:10px;opacity:.9;">
-                        <b>RUC:</b> {_val(res.get("ruc") or ruc)}<br/>
-                        <b>Dirección:</b> {direccion}<br/>
-                        <b>Estado / Condición:</b> {estado} / {condicion}
-                      </div>
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
+                st.markdown(_card_ruc(res, ruc), unsafe_allow_html=True)
 
                 with st.expander("Ver respuesta técnica (JSON)"):
-                    st.code(json.dumps(res, indent=2, ensure_ascii=False), language="json")
+                    st.code(_json_legible(res), language="json")
 
             except ValueError as e:
                 st.error(str(e))
@@ -2,23 +2,70 @@
 
 from __future__ import annotations
 
+import copy
+import json
+import logging
 import os
-from typing import Any, Dict, Optional
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, Union
 
 import requests
 import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:  # opcional: pip install orjson (parser en Rust, lee bytes directo)
+    import orjson
+except ImportError:
+    orjson = None
+
+# json.loads también acepta bytes: en ambos casos se evita resp.json(), que
+# primero decodifica todo el cuerpo a str.
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+
+def _json_dumps_legible(obj: Any) -> str:
+    """JSON indentado (2 espacios, sin escapar tildes) para mostrar en pantalla."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, indent=2, ensure_ascii=False)
 
 BASE_URL = "https://api.codart.cgrt.net/api/v1/consultas"
 
+_log = logging.getLogger(__name__)
+
+# (conexión, lectura) en segundos. La API responde en ~1 s: una conexión
+# muerta falla rápido y libera el hilo de Streamlit. Solo el último intento
+# de la cadena espera más.
+TIMEOUT_INTENTO = (3.05, 8)
+TIMEOUT_ULTIMO = (3.05, 20)
+
+# Validación en una sola pasada (largo + solo dígitos ASCII)
+_DNI_RE = re.compile(r"[0-9]{8}")
+_RUC_RE = re.compile(r"[0-9]{11}")
+
 
 class CodartAPIError(Exception):
     """Errores al consumir CODART (token, límites, caídas, WAF, etc.)."""
 
+    def __init__(self, msg: str, status: Optional[int] = None):
+        super().__init__(msg)
+        # Código HTTP de la respuesta que originó el error (None si no hubo)
+        self.status = status
 
+
+@lru_cache(maxsize=1)
 def _get_token() -> str:
     """
     Streamlit Cloud: usa st.secrets["CODART_TOKEN"].
     Fallback: variable de entorno CODART_TOKEN.
+    Se lee una vez por proceso (si falta, el error no se memoriza y se
+    vuelve a intentar en la siguiente llamada).
     """
     token = None
     try:
@@ -39,39 +86,78 @@ def _get_token() -> str:
 @st.cache_resource
 def _get_session(token: str) -> requests.Session:
     """
-    Session cacheada (mejor performance) + headers anti-406/WAF.
-    Queda cacheada por token: si cambias el secret, se crea otra sesión.
+    Session cacheada: reutiliza la conexión keep-alive (sin nuevo handshake
+    TCP/TLS por consulta) + headers anti-406/WAF.
+    Queda cacheada por token (un cambio del secret aplica al reiniciar la app).
     """
     s = requests.Session()
+    # Reintento corto ante 5xx transitorios (no llegan al usuario como error)
+    reintentos = Retry(
+        total=2,
+        backoff_factor=0.3,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=["GET", "POST"],
+        raise_on_status=False,
+    )
+    # Pool dimensionado para varias sesiones de Streamlit consultando a la vez
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=reintentos)
+    s.mount("https://", adapter)
     s.headers.update(
         {
             "Authorization": f"Bearer {token}",
-            "Accept": "application/json",
-            # clave para evitar bloqueos típicos en Cloud/WAF:
-            "User-Agent": "Mozilla/5.0 (Streamlit; CODART client)",
+            # ModSecurity suele bloquear requests “sin cara de navegador”
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120 Safari/537.36",
+            "Accept": "*/*",  # evita 406 por negociación de contenido
+            "Accept-Language": "es-PE,es;q=0.9,en;q=0.8",
+            "Content-Type": "application/json",  # tu API lo exige (415)
         }
     )
     return s
 
-def _get_json(url: str, params: Optional[dict] = None) -> Dict[str, Any]:
-    token = _get_token()
 
-    session = requests.Session()
+def _session() -> requests.Session:
+    return _get_session(_get_token())
+
+
+@st.cache_resource(show_spinner=False)
+def _pool() -> ThreadPoolExecutor:
+    """
+    Pool de consultar_batch, creado en el primer uso: las consultas son I/O
+    puro (esperan a la red), los hilos solapan la espera y N consultas
+    tardan ~ la más lenta.
+    """
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="codart")
+
+
+@st.cache_resource(show_spinner=False)
+def _pool_refresco() -> ThreadPoolExecutor:
+    """Pool de los refrescos en segundo plano del caché SWR (primer uso)."""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="codart-swr")
+
+
+# Variante que pasó el WAF por endpoint (clave = plantilla de la URL, así
+# todos los DNI comparten lo aprendido). Las siguientes consultas van directo
+# con ella en vez de repetir antes el GET que el servidor rechaza.
+_VARIANTE_OK: Dict[str, str] = {}
+
 
-    headers = {
-        "Authorization": f"Bearer {token}",
-        # ModSecurity suele bloquear requests “sin cara de navegador”
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120 Safari/537.36",
-        "Accept": "*/*",  # evita 406 por negociación de contenido
-        "Accept-Language": "es-PE,es;q=0.9,en;q=0.8",
-        "Content-Type": "application/json",  # tu API lo exige (415)
-    }
+def _get_json(
+    url: str,
+    params: Optional[dict] = None,
+    clave: Optional[str] = None,
+    session: Optional[requests.Session] = None,
+) -> Dict[str, Any]:
+    if session is None:
+        session = _session()
+    clave = clave or url
 
     def parse(resp: requests.Response) -> Dict[str, Any]:
         try:
-            data = resp.json()
+            data = _json_loads(resp.content)
         except Exception:
-            raise CodartAPIError(f"HTTP {resp.status_code}: {(resp.text or '')[:300]}")
+            raise CodartAPIError(
+                f"HTTP {resp.status_code}: {(resp.text or '')[:300]}", status=resp.status_code
+            )
 
         if not isinstance(data, dict):
             raise CodartAPIError("Respuesta inesperada (no es dict).")
@@ -82,56 +168,70 @@ def _get_json(url: str, params: Optional[dict] = None) -> Dict[str, Any]:
 
         return data
 
+    def enviar(variante: str, timeout=TIMEOUT_INTENTO) -> requests.Response:
+        if variante == "POST":
+            return session.post(url, json=(params or {}), timeout=timeout)
+        if variante == "GET_SIN_PARAMS":
+            return session.get(url, timeout=timeout)
+        return session.get(url, params=params, timeout=timeout)
+
+    # Variante ya aprendida: un solo intento. Si deja de funcionar, se olvida
+    # y se sigue con la cadena completa.
+    recordada = _VARIANTE_OK.get(clave)
+    if recordada:
+        resp = enviar(recordada)
+        if resp.status_code < 400:
+            return parse(resp)
+        _VARIANTE_OK.pop(clave, None)
+
     # Intento 1: GET
-    resp = session.get(url, headers=headers, params=params, timeout=25)
+    resp = enviar("GET")
 
     # Si WAF bloquea (406) o Content-Type (415), probamos variantes
     if resp.status_code in (406, 415, 403):
         # Intento 2: POST con JSON (muchas APIs terminan aceptando esto mejor)
-        resp2 = session.post(url, headers=headers, json=(params or {}), timeout=25)
+        resp2 = enviar("POST")
         if resp2.status_code < 400:
+            _VARIANTE_OK[clave] = "POST"
             return parse(resp2)
 
         # Intento 3: GET sin params (si params causan regla WAF), y params en URL “manual”
         # (opcional, útil si el WAF odia ciertos patrones)
-        resp3 = session.get(url, headers=headers, timeout=25)
+        resp3 = enviar("GET_SIN_PARAMS", timeout=TIMEOUT_ULTIMO)
         if resp3.status_code < 400:
+            _VARIANTE_OK[clave] = "GET_SIN_PARAMS"
             return parse(resp3)
 
-        # Si nada funcionó, muestra ambos para debug
+        # Si nada funcionó, muestra ambos para debug. Sin `status`: ya se
+        # probaron todas las variantes, no corresponde pasar a la URL B.
         raise CodartAPIError(
             f"Bloqueado por servidor/WAF. GET={resp.status_code} POST={resp2.status_code}. "
             f"GET body: {(resp.text or '')[:200]}"
         )
 
     if resp.status_code >= 400:
-        raise CodartAPIError(f"HTTP {resp.status_code}: {(resp.text or '')[:300]}")
+        raise CodartAPIError(
+            f"HTTP {resp.status_code}: {(resp.text or '')[:300]}", status=resp.status_code
+        )
 
     return parse(resp)
 
 
-
-
 def validar_dni(dni: str) -> str:
-    dni = (dni or "").strip()
-    if not (dni.isdigit() and len(dni) == 8):
+    dni = dni.strip() if dni else ""
+    if not _DNI_RE.fullmatch(dni):
         raise ValueError("DNI inválido. Debe tener 8 dígitos.")
     return dni
 
 
 def validar_ruc(ruc: str) -> str:
-    ruc = (ruc or "").strip()
-    if not (ruc.isdigit() and len(ruc) == 11):
+    ruc = ruc.strip() if ruc else ""
+    if not _RUC_RE.fullmatch(ruc):
         raise ValueError("RUC inválido. Debe tener 11 dígitos.")
     return ruc
 
 
-@st.cache_data(ttl=60 * 60 * 24)  # 24h
-def consultar_dni(dni: str) -> Dict[str, Any]:
-    """
-    RENIEC DNI.
-    Soporta /reniec/dni/{dni} y /reniec/dni/dni?dni=...
-    """
+def _consultar_dni(dni: str, session: Optional[requests.Session] = None) -> Dict[str, Any]:
     dni_ok = validar_dni(dni)
 
     url_a = f"{BASE_URL}/reniec/dni/{dni_ok}"
@@ -139,22 +239,16 @@ def consultar_dni(dni: str) -> Dict[str, Any]:
     params_b = {"dni": dni_ok}
 
     try:
-        data = _get_json(url_a)
+        data = _get_json(url_a, clave="/reniec/dni/{dni}", session=session)
         return data.get("result", {}) or {}
     except CodartAPIError as e:
-        msg = str(e)
-        if "HTTP 404" in msg or "HTTP 406" in msg:
-            data = _get_json(url_b, params=params_b)
+        if e.status in (404, 406):
+            data = _get_json(url_b, params=params_b, clave="/reniec/dni/dni", session=session)
             return data.get("result", {}) or {}
         raise
 
 
-@st.cache_data(ttl=60 * 60 * 24)  # 24h
-def consultar_ruc(ruc: str) -> Dict[str, Any]:
-    """
-    SUNAT RUC.
-    Soporta /sunat/ruc/{ruc} y /sunat/ruc/ruc?ruc=...
-    """
+def _consultar_ruc(ruc: str, session: Optional[requests.Session] = None) -> Dict[str, Any]:
     ruc_ok = validar_ruc(ruc)
 
     url_a = f"{BASE_URL}/sunat/ruc/{ruc_ok}"
@@ -162,29 +256,150 @@ def consultar_ruc(ruc: str) -> Dict[str, Any]:
     params_b = {"ruc": ruc_ok}
 
     try:
-        data = _get_json(url_a)
+        data = _get_json(url_a, clave="/sunat/ruc/{ruc}", session=session)
         return data.get("result", {}) or {}
     except CodartAPIError as e:
-        msg = str(e)
-        if "HTTP 404" in msg or "HTTP 406" in msg:
-            data = _get_json(url_b, params=params_b)
+        if e.status in (404, 406):
+            data = _get_json(url_b, params=params_b, clave="/sunat/ruc/ruc", session=session)
             return data.get("result", {}) or {}
         raise
 
 
+# ===== Caché stale-while-revalidate de consultas =====
+# Hasta SWR_TTL_FRESCO la respuesta se devuelve tal cual. Entre ese tiempo y
+# SWR_TTL_MAXIMO también se devuelve al instante, pero se lanza un refresco en
+# segundo plano: el usuario nunca espera el viaje a CODART por un TTL vencido.
+SWR_TTL_FRESCO = 60 * 60 * 24  # 24h
+SWR_TTL_MAXIMO = 60 * 60 * 24 * 7  # 7 días
+SWR_MAX_ENTRADAS = 2048
+
+_SWR: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_SWR_EN_CURSO = set()
+_SWR_LOCK = threading.Lock()
+
+Consulta = Callable[[str, Optional[requests.Session]], Dict[str, Any]]
+
+
+def _swr_guardar(clave: Tuple[str, str], valor: Dict[str, Any]) -> None:
+    with _SWR_LOCK:
+        _SWR[clave] = (time.monotonic(), valor)
+        _SWR.move_to_end(clave)
+        while len(_SWR) > SWR_MAX_ENTRADAS:
+            _SWR.popitem(last=False)
+
+
+def _swr_refrescar(clave: Tuple[str, str], consulta: Consulta, session: requests.Session) -> None:
+    try:
+        _swr_guardar(clave, consulta(clave[1], session))
+    except Exception:
+        # Se conserva el valor anterior; la próxima consulta vencida lo reintenta
+        _log.warning("No se pudo refrescar una consulta %s en CODART", clave[0], exc_info=True)
+    finally:
+        with _SWR_LOCK:
+            _SWR_EN_CURSO.discard(clave)
+
+
+def _consulta_swr(
+    tipo: str, doc: str, consulta: Consulta, session: Optional[requests.Session] = None
+) -> Dict[str, Any]:
+    clave = (tipo, doc)
+    refrescar = False
+    with _SWR_LOCK:
+        entrada = _SWR.get(clave)
+        if entrada is not None:
+            edad = time.monotonic() - entrada[0]
+            if edad >= SWR_TTL_MAXIMO:
+                entrada = None
+            else:
+                _SWR.move_to_end(clave)
+                if edad >= SWR_TTL_FRESCO and clave not in _SWR_EN_CURSO:
+                    _SWR_EN_CURSO.add(clave)
+                    refrescar = True
+
+    if entrada is None:
+        valor = consulta(doc, session)  # los errores se propagan y no se guardan
+        _swr_guardar(clave, valor)
+        return copy.deepcopy(valor)
+
+    if refrescar:
+        # La sesión se obtiene en el hilo de Streamlit (usa sus cachés)
+        _pool_refresco().submit(_swr_refrescar, clave, consulta, session or _session())
+    # Copia, como hacía st.cache_data: quien la modifique no toca el caché
+    return copy.deepcopy(entrada[1])
+
+
+def consultar_dni(dni: str) -> Dict[str, Any]:
+    """
+    RENIEC DNI.
+    Soporta /reniec/dni/{dni} y /reniec/dni/dni?dni=...
+    """
+    return _consulta_swr("dni", validar_dni(dni), _consultar_dni)
+
+
+def consultar_ruc(ruc: str) -> Dict[str, Any]:
+    """
+    SUNAT RUC.
+    Soporta /sunat/ruc/{ruc} y /sunat/ruc/ruc?ruc=...
+    """
+    return _consulta_swr("ruc", validar_ruc(ruc), _consultar_ruc)
+
+
+def _consultar_dni_swr(dni: str, session: requests.Session) -> Dict[str, Any]:
+    return _consulta_swr("dni", validar_dni(dni), _consultar_dni, session)
+
+
+def _consultar_ruc_swr(ruc: str, session: requests.Session) -> Dict[str, Any]:
+    return _consulta_swr("ruc", validar_ruc(ruc), _consultar_ruc, session)
+
+
+def consultar_batch(
+    dnis: Iterable[str] = (), rucs: Iterable[str] = ()
+) -> Dict[str, Union[Dict[str, Any], Exception]]:
+    """
+    Consulta varios DNI / RUC a la vez (p. ej. una carga masiva, o DNI + RUC
+    del mismo solicitante).
+    Devuelve {documento: result} y, para los que fallan, {documento: excepción}
+    (ValueError o CodartAPIError) en vez de cortar todo el lote.
+    La sesión se obtiene aquí, en el hilo de Streamlit; los hilos del pool
+    solo hacen la petición. Comparte el caché SWR de consultar_dni/ruc.
+    """
+    session = _session()
+    pool = _pool()
+    futuros = {}
+    # Un documento repetido en la entrada se consulta una sola vez
+    for dni in dnis:
+        if dni not in futuros:
+            futuros[dni] = pool.submit(_consultar_dni_swr, dni, session)
+    for ruc in rucs:
+        if ruc not in futuros:
+            futuros[ruc] = pool.submit(_consultar_ruc_swr, ruc, session)
+
+    resultados: Dict[str, Union[Dict[str, Any], Exception]] = {}
+    for doc, futuro in futuros.items():
+        try:
+            resultados[doc] = futuro.result()
+        except (ValueError, CodartAPIError) as e:
+            resultados[doc] = e
+    return resultados
+
+
+_CLAVES_NOMBRE = ("first_name", "first_last_name", "second_last_name")
+
+
 def dni_a_nombre_completo(res: Dict[str, Any]) -> str:
     """
     Arma nombre completo con el orden:
       NOMBRES APELLIDO_PATERNO APELLIDO_MATERNO
     """
-    nombres = (res.get("first_name") or "").strip()
-    ape1 = (res.get("first_last_name") or "").strip()
-    ape2 = (res.get("second_last_name") or "").strip()
+    partes = []
+    for k in _CLAVES_NOMBRE:
+        v = res.get(k)
+        if v and (v := v.strip()):
+            partes.append(v)
 
-    # Si viene todo vacío, intenta fallback con full_name (por si cambia la API)
-    if not (nombres or ape1 or ape2):
-        full = (res.get("full_name") or "").strip()
-        return full
+    if partes:
+        return " ".join(partes).upper()
 
-    return " ".join([p for p in [nombres, ape1, ape2] if p]).upper().strip()
+    # Si viene todo vacío, intenta fallback con full_name (por si cambia la API)
+    return (res.get("full_name") or "").strip()
 
@@ -1,14 +1,13 @@
 # licencias/app_compatibilidad.py
 
-import io
 import os
 from datetime import date
 
 import streamlit as st
-from docxtpl import DocxTemplate
 
 from integraciones.codart import (
     CodartAPIError,
+    consultar_batch,
     consultar_dni,
     consultar_ruc,
     dni_a_nombre_completo,
@@ -53,53 +52,63 @@ ZONAS = [
     ("I4",    "Industria Pesada Básica"),
 ]
 ZONAS_DICT = {c: d for c, d in ZONAS}
+# Opciones del selectbox de zonificación (fijas: se arman una vez al importar)
+ZONA_OPCIONES = tuple(f"{c} – {d}" for c, d in ZONAS)
 
-ORDENANZAS = [
+ORDENANZAS = (
     "ORD. 1117-MML",
     "ORD. 1146-MML",
     "ORD. 2236-MML",
     "ORD. 933-MML",
     "ORD. 270-2021-PACHACAMAC",
-]
+)
 
 
 # -------------------- Helpers --------------------
 
+_MESES_ABREV = ("ENE", "FEB", "MAR", "ABR", "MAY", "JUN",
+                "JUL", "AGO", "SET", "OCT", "NOV", "DIC")
+
+
 def fecha_mes_abrev(d: date) -> str:
     """Ej: 16 DIC 2025 (para el paréntesis del expediente)."""
     if not d:
         return ""
-    meses = ["ENE", "FEB", "MAR", "ABR", "MAY", "JUN",
-             "JUL", "AGO", "SET", "OCT", "NOV", "DIC"]
-    return f"{d.day:02d} {meses[d.month - 1]} {d.year}"
+    return f"{d.day:02d} {_MESES_ABREV[d.month - 1]} {d.year}"
+
+
+def _vacio(v) -> bool:
+    """True si el campo está vacío o solo tiene espacios (sin str() si ya es texto)."""
+    if type(v) is str:
+        return not v.strip()
+    return v is None or not str(v).strip()
 
 
 def render_doc(context: dict, filename_stem: str, plantilla_path: str):
     """Renderiza la plantilla Word y muestra botón de descarga."""
-    try:
-        doc = DocxTemplate(plantilla_path)
-    except Exception as e:
+    # docxtpl (lxml + jinja2) se importa recién al generar el primer documento
+    from plantillas_docx import renderizar_docx
+
+    if not os.path.exists(plantilla_path):
         st.error(f"No se pudo abrir la plantilla: {plantilla_path}")
-        st.error(str(e))
         return
 
     try:
-        doc.render(context, autoescape=True)
+        # Bytes del .docx final cacheados por (plantilla, fecha de modificación,
+        # contexto): volver a generar el mismo documento no re-renderiza.
+        # Sin BytesIO de por medio: download_button recibe los bytes tal cual.
+        datos = renderizar_docx(plantilla_path, context, autoescape=True)
     except Exception as e:
         st.error("Ocurrió un error al rellenar la plantilla.")
         st.error(str(e))
         return
 
-    buffer = io.BytesIO()
-    doc.save(buffer)
-    buffer.seek(0)
-
     out_name = safe_filename_pretty(filename_stem) + ".docx"
 
     st.success(f"Documento generado: {out_name}")
     st.download_button(
         "⬇️ Descargar compatibilidad en Word",
-        data=buffer,
+        data=datos,
         file_name=out_name,
         mime=(
             "application/vnd.openxmlformats-"
@@ -149,106 +158,165 @@ def _autocompletar_con_ruc():
         _set_flash("error", f"Error inesperado consultando RUC: {e}")
 
 
+def _autocompletar_ambos():
+    """
+    DNI y RUC a la vez: ambas consultas van en paralelo (consultar_batch),
+    así se espera una sola vez. Prima la razón social (SUNAT); si no llegó,
+    se usa el nombre de RENIEC.
+    """
+    st.session_state["_last_action"] = "ambos"
+    dni = (st.session_state.get("dni") or "").strip()
+    ruc = (st.session_state.get("ruc") or "").strip()
+    if not (dni or ruc):
+        _set_flash("warning", "Ingresa el DNI y/o el RUC para autocompletar.")
+        return
+
+    try:
+        resultados = consultar_batch(dnis=[dni] if dni else (), rucs=[ruc] if ruc else ())
+    except Exception as e:
+        _set_flash("error", f"Error inesperado consultando DNI/RUC: {e}")
+        return
+
+    nombre = razon = ""
+    errores = []
+    res_dni = resultados.get(dni) if dni else None
+    if isinstance(res_dni, Exception):
+        errores.append(f"DNI: {res_dni}")
+    elif res_dni is not None:
+        nombre = (dni_a_nombre_completo(res_dni) or "").strip()
+    res_ruc = resultados.get(ruc) if ruc else None
+    if isinstance(res_ruc, Exception):
+        errores.append(f"RUC: {res_ruc}")
+    elif res_ruc is not None:
+        razon = (res_ruc.get("razon_social") or "").strip()
+
+    persona = razon or nombre
+    if not persona:
+        if errores:
+            _set_flash("error", " | ".join(errores))
+        else:
+            _set_flash("warning", "RENIEC/SUNAT respondieron, pero no llegó el nombre ni la razón social.")
+        return
+
+    st.session_state["persona"] = persona
+    origen = "SUNAT (RUC)" if razon else "RENIEC (DNI)"
+    if errores:
+        _set_flash("warning", f"Solicitante actualizado con {origen}. " + " | ".join(errores))
+    else:
+        _set_flash("success", f"Solicitante actualizado con {origen}.")
+
+
+# -------------------- Estilos --------------------
+_CSS_COMPATIBILIDAD = """
+    <style>
+    .block-container {
+        padding-top: 0.9rem;
+        max-width: 980px;
+        background: #f7f9fc;
+        border-radius: 12px;
+        padding-left: 14px;
+        padding-right: 14px;
+        padding-bottom: 18px;
+    }
+    .stButton>button {
+        border-radius: 10px;
+        padding: .55rem 1rem;
+        font-weight: 600;
+        border: 1px solid #cbd5e1;
+        background: #ffffff;
+    }
+    .stButton>button:hover {
+        border-color: #94a3b8;
+        background: #f8fafc;
+    }
+    .card {
+        border: 1px solid #d7dee8;
+        border-radius: 16px;
+        padding: 18px 20px;
+        margin-bottom: 18px;
+        background: #ffffff;
+        box-shadow: 0 2px 6px rgba(15, 23, 42, 0.05);
+    }
+    .subcard {
+        border: 1px solid #dbeafe;
+        border-radius: 12px;
+        padding: 12px 14px 8px 14px;
+        background: #f8fbff;
+        margin: 10px 0 12px 0;
+    }
+    .section-title {
+        font-size: 0.92rem;
+        text-transform: uppercase;
+        letter-spacing: .08em;
+        color: #475569;
+        margin-bottom: 0.45rem;
+        font-weight: 700;
+    }
+    .section-divider {
+        margin: 0.5rem 0 1rem 0;
+        border-top: 1px solid #e2e8f0;
+    }
+    /* Mejor contraste en campos */
+    .stTextInput label, .stTextArea label, .stSelectbox label, .stMultiSelect label {
+        color: #334155 !important;
+        font-weight: 600;
+    }
+    .stTextInput input, .stTextArea textarea {
+        background: #ffffff !important;
+        border: 1px solid #cbd5e1 !important;
+        color: #0f172a !important;
+    }
+    .stTextInput input:focus, .stTextArea textarea:focus {
+        border-color: #2563eb !important;
+        box-shadow: 0 0 0 1px #2563eb !important;
+    }
+    .stSelectbox [data-baseweb="select"] > div,
+    .stMultiSelect [data-baseweb="select"] > div {
+        background: #ffffff !important;
+        border: 1px solid #cbd5e1 !important;
+        color: #0f172a !important;
+    }
+    .stSelectbox [data-baseweb="select"] > div:focus-within,
+    .stMultiSelect [data-baseweb="select"] > div:focus-within {
+        border-color: #2563eb !important;
+        box-shadow: 0 0 0 1px #2563eb !important;
+    }
+    </style>
+"""
+
+
 # -------------------- Módulo principal --------------------
 
 def run_modulo_compatibilidad():
     st.header("🏢 Evaluación de Compatibilidad de Uso")
 
-    asegurar_dirs()
-    os.makedirs("plantilla_compa", exist_ok=True)
+    # Carpetas: una vez por sesión, no en cada rerun
+    if not st.session_state.get("_compa_dirs_ok"):
+        asegurar_dirs()
+        os.makedirs("plantilla_compa", exist_ok=True)
+        st.session_state["_compa_dirs_ok"] = True
 
     # rutas fijas de las plantillas
     TPL_COMP_INDETERMINADA = "plantilla_compa/compatibilidad_indeterminada.docx"
     TPL_COMP_TEMPORAL = "plantilla_compa/compatibilidad_temporal.docx"
 
-    # Defaults
-    st.session_state.setdefault("persona", "")
-    st.session_state.setdefault("dni", "")
-    st.session_state.setdefault("ruc", "")
-    st.session_state.setdefault("_flash_kind", "")
-    st.session_state.setdefault("_flash_text", "")
-    st.session_state.setdefault("_last_action", "")
+    # Defaults (una sola vez por sesión; los accesos usan .get, así que si
+    # Streamlit descarta luego un widget al cambiar de módulo no pasa nada)
+    if "_compa_init" not in st.session_state:
+        st.session_state.update(
+            {
+                "persona": "",
+                "dni": "",
+                "ruc": "",
+                "_flash_kind": "",
+                "_flash_text": "",
+                "_last_action": "",
+                "_compa_init": True,
+            }
+        )
 
     # Estilos visuales
-    st.markdown(
-        """
-        <style>
-        .block-container {
-            padding-top: 0.9rem;
-            max-width: 980px;
-            background: #f7f9fc;
-            border-radius: 12px;
-            padding-left: 14px;
-            padding-right: 14px;
-            padding-bottom: 18px;
-        }
-        .stButton>button {
-            border-radius: 10px;
-            padding: .55rem 1rem;
-            font-weight: 600;
-            border: 1px solid #cbd5e1;
-            background: #ffffff;
-        }
-        .stButton>button:hover {
-            border-color: #94a3b8;
-            background: #f8fafc;
-        }
-        .card {
-            border: 1px solid #d7dee8;
-            border-radius: 16px;
-            padding: 18px 20px;
-            margin-bottom: 18px;
-            background: #ffffff;
-            box-shadow: 0 2px 6px rgba(15, 23, 42, 0.05);
-        }
-        .subcard {
-            border: 1px solid #dbeafe;
-            border-radius: 12px;
-            padding: 12px 14px 8px 14px;
-            background: #f8fbff;
-            margin: 10px 0 12px 0;
-        }
-        .section-title {
-            font-size: 0.92rem;
-            text-transform: uppercase;
-            letter-spacing: .08em;
-            color: #475569;
-            margin-bottom: 0.45rem;
-            font-weight: 700;
-        }
-        .section-divider {
-            margin: 0.5rem 0 1rem 0;
-            border-top: 1px solid #e2e8f0;
-        }
-        /* Mejor contraste en campos */
-        .stTextInput label, .stTextArea label, .stSelectbox label, .stMultiSelect label {
-            color: #334155 !important;
-            font-weight: 600;
-        }
-        .stTextInput input, .stTextArea textarea {
-            background: #ffffff !important;
-            border: 1px solid #cbd5e1 !important;
-            color: #0f172a !important;
-        }
-        .stTextInput input:focus, .stTextArea textarea:focus {
-            border-color: #2563eb !important;
-            box-shadow: 0 0 0 1px #2563eb !important;
-        }
-        .stSelectbox [data-baseweb="select"] > div,
-        .stMultiSelect [data-baseweb="select"] > div {
-            background: #ffffff !important;
-            border: 1px solid #cbd5e1 !important;
-            color: #0f172a !important;
-        }
-        .stSelectbox [data-baseweb="select"] > div:focus-within,
-        .stMultiSelect [data-baseweb="select"] > div:focus-within {
-            border-color: #2563eb !important;
-            box-shadow: 0 0 0 1px #2563eb !important;
-        }
-        </style>
-        """,
-        unsafe_allow_html=True,
-    )
+    st.markdown(_CSS_COMPATIBILIDAD, unsafe_allow_html=True)
 
     # Flash message (si hubo autocompletar)
     if st.session_state.get("_flash_text"):
@@ -268,8 +336,83 @@ def run_modulo_compatibilidad():
 
     st.markdown('<div class="card">', unsafe_allow_html=True)
 
+    # Fuera del formulario solo va lo que debe reaccionar al instante: DNI/RUC
+    # con sus botones de autocompletar (callbacks) y las cantidades de
+    # actividades/giros (definen cuántos campos muestra el formulario).
+    # Todo lo demás va en st.form: escribir no dispara reruns hasta "Generar".
+
+    # ---------------- Consulta RENIEC / SUNAT ----------------
+    st.markdown(
+        '<div class="section-title">Consulta RENIEC / SUNAT</div>',
+        unsafe_allow_html=True,
+    )
+
+    c1, c2 = st.columns(2)
+    with c1:
+        st.text_input("DNI (si es persona natural)", max_chars=8, key="dni")
+    with c2:
+        st.text_input("RUC (si es persona jurídica)", max_chars=11, key="ruc")
+
+    # Botones: usan callback (NO rompe session_state)
+    b1, b2, b3 = st.columns(3)
+    with b1:
+        st.button(
+            "⚡ Autocompletar solicitante con DNI",
+            use_container_width=True,
+            on_click=_autocompletar_con_dni,
+            key="btn_auto_dni_compa",
+        )
+    with b2:
+        st.button(
+            "⚡ Autocompletar solicitante con RUC",
+            use_container_width=True,
+            on_click=_autocompletar_con_ruc,
+            key="btn_auto_ruc_compa",
+        )
+    with b3:
+        st.button(
+            "⚡ Autocompletar con DNI y RUC",
+            use_container_width=True,
+            on_click=_autocompletar_ambos,
+            key="btn_auto_ambos_compa",
+        )
+
+    st.markdown('<hr class="section-divider" />', unsafe_allow_html=True)
+
+    # ---------------- Cantidad de actividades y giros ----------------
+    st.markdown(
+        '<div class="section-title">Actividades generales y giros</div>',
+        unsafe_allow_html=True,
+    )
+
+    sel_act_col, _ = st.columns([1, 2])
+    with sel_act_col:
+        n_actividades = st.selectbox(
+            "N° de actividades generales*",
+            options=[1, 2, 3, 4, 5],
+            index=0,
+            key="n_actividades_compa",
+        )
+    n_actividades = int(n_actividades)
+
+    n_giros = []
+    cols_giros = st.columns(n_actividades)
+    for i in range(n_actividades):
+        with cols_giros[i]:
+            n_giros_i = st.selectbox(
+                f"N° de giros para actividad {i + 1}*",
+                options=[1, 2, 3, 4, 5, 6, 7, 8, 9, 10],
+                index=0,
+                key=f"n_giros_tabla_{i + 1}",
+            )
+        n_giros.append(int(n_giros_i))
+
+    st.markdown("</div>", unsafe_allow_html=True)
+
+    st.markdown('<div class="card">', unsafe_allow_html=True)
+
     # ---------- Formulario principal ----------
-    with st.container():
+    with st.form("compa_form", clear_on_submit=False):
 
         # ---------------- Encabezado ----------------
         st.markdown(
@@ -293,28 +436,9 @@ def run_modulo_compatibilidad():
         c1, c2 = st.columns(2)
         with c1:
             st.text_input("Solicitante*", max_chars=150, key="persona")
-            st.text_input("DNI (si es persona natural)", max_chars=8, key="dni")
         with c2:
-            st.text_input("RUC (si es persona jurídica)", max_chars=11, key="ruc")
             nom_comercio = st.text_input("Nombre comercial (opcional)")
 
-        # Botones: usan callback (NO rompe session_state)
-        b1, b2 = st.columns(2)
-        with b1:
-            st.button(
-                "⚡ Autocompletar solicitante con DNI",
-                use_container_width=True,
-                on_click=_autocompletar_con_dni,
-                key="btn_auto_dni_compa",
-            )
-        with b2:
-            st.button(
-                "⚡ Autocompletar solicitante con RUC",
-                use_container_width=True,
-                on_click=_autocompletar_con_ruc,
-                key="btn_auto_ruc_compa",
-            )
-
         direccion = st.text_input("Dirección*", max_chars=200)
 
         st.markdown('<hr class="section-divider" />', unsafe_allow_html=True)
@@ -373,17 +497,6 @@ def run_modulo_compatibilidad():
             unsafe_allow_html=True,
         )
 
-        sel_act_col, _ = st.columns([1, 2])
-        with sel_act_col:
-            n_actividades = st.selectbox(
-                "N° de actividades generales*",
-                options=[1, 2, 3, 4, 5],
-                index=0,
-                key="n_actividades_compa",
-            )
-        n_actividades = int(n_actividades)
-        zona_opciones = [f"{c} – {d}" for c, d in ZONAS]
-
         actividades_generales = []
         for i in range(n_actividades):
             st.markdown('<div class="subcard">', unsafe_allow_html=True)
@@ -404,24 +517,14 @@ def run_modulo_compatibilidad():
 
             zona_sel_i = st.selectbox(
                 f"Zonificación (código) actividad {i + 1}*",
-                zona_opciones,
+                ZONA_OPCIONES,
                 key=f"zona_sel_{i + 1}",
             )
             zona_codigo_i = zona_sel_i.split(" – ")[0]
             zona_desc_i = ZONAS_DICT.get(zona_codigo_i, "")
 
-            sel_giro_col, _ = st.columns([1, 2])
-            with sel_giro_col:
-                n_giros_i = st.selectbox(
-                    f"N° de giros para actividad {i + 1}*",
-                    options=[1, 2, 3, 4, 5, 6, 7, 8, 9, 10],
-                    index=0,
-                    key=f"n_giros_tabla_{i + 1}",
-                )
-            n_giros_i = int(n_giros_i)
-
             giros_i = []
-            for j in range(n_giros_i):
+            for j in range(n_giros[i]):
                 st.markdown(f"Giro {j + 1} de actividad {i + 1}")
                 cg1, cg2, cg3 = st.columns([2, 4, 2])
                 with cg1:
@@ -489,12 +592,12 @@ def run_modulo_compatibilidad():
         )
 
         st.markdown("")
-        generar = st.button("🧾 Generar compatibilidad (.docx)", key="btn_generar_compa")
+        generar = st.form_submit_button("🧾 Generar compatibilidad (.docx)")
 
     st.markdown("</div>", unsafe_allow_html=True)
 
     # Si el submit fue por autocompletar, NO generamos (evita consumir lógica y errores)
-    if st.session_state.get("_last_action") in ("dni", "ruc"):
+    if st.session_state.get("_last_action") in ("dni", "ruc", "ambos"):
         st.session_state["_last_action"] = ""
         st.stop()
 
@@ -514,20 +617,21 @@ def run_modulo_compatibilidad():
     dni = (st.session_state.get("dni") or "").strip()
     ruc = (st.session_state.get("ruc") or "").strip()
 
-    faltantes = []
-    for key, val in {
-        "n_compa": n_compa,
-        "persona": persona,
-        "direccion": direccion,
-        "giro": giro,
-        "area": area,
-        "itse": itse,
-        "certificador": certificador,
-        "tipo_licencia": tipo_licencia,
-        "ds": ds,
-    }.items():
-        if isinstance(val, str) and not val.strip():
-            faltantes.append(key)
+    faltantes = [
+        key
+        for key, val in (
+            ("n_compa", n_compa),
+            ("persona", persona),
+            ("direccion", direccion),
+            ("giro", giro),
+            ("area", area),
+            ("itse", itse),
+            ("certificador", certificador),
+            ("tipo_licencia", tipo_licencia),
+            ("ds", ds),
+        )
+        if _vacio(val)
+    ]
 
     if not ordenanzas_sel:
         faltantes.append("ordenanzas")
@@ -541,11 +645,11 @@ def run_modulo_compatibilidad():
         faltantes.append("actividades_generales")
     else:
         for idx, ag in enumerate(actividades_generales, start=1):
-            if not str(ag.get("actividad", "")).strip():
+            if _vacio(ag.get("actividad")):
                 faltantes.append(f"actividad_{idx}")
-            if not str(ag.get("codigo", "")).strip():
+            if _vacio(ag.get("codigo")):
                 faltantes.append(f"codigo_actividad_{idx}")
-            if not str(ag.get("zona", "")).strip():
+            if _vacio(ag.get("zona")):
                 faltantes.append(f"zona_{idx}")
 
             giros_ag = ag.get("giros", []) or []
@@ -553,9 +657,9 @@ def run_modulo_compatibilidad():
                 faltantes.append(f"giros_actividad_{idx}")
             else:
                 for jdx, fila in enumerate(giros_ag, start=1):
-                    if not str(fila.get("codigo", "")).strip():
+                    if _vacio(fila.get("codigo")):
                         faltantes.append(f"codigo_giro_{idx}_{jdx}")
-                    if not str(fila.get("giro", "")).strip():
+                    if _vacio(fila.get("giro")):
                         faltantes.append(f"desc_giro_{idx}_{jdx}")
 
     if faltantes:
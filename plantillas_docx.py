@@ -0,0 +1,213 @@
+# plantillas_docx.py
+"""
+Carga de plantillas Word (docxtpl) con caché por proceso.
+
+- Los bytes del .docx y el XML del cuerpo ya "parchado" por docxtpl
+  (get_xml + patch_xml) se calculan una sola vez por plantilla.
+  La clave incluye la fecha de modificación: si se reemplaza el .docx,
+  se vuelve a leer solo.
+- Un único jinja2.Environment por modo de autoescape para todas las plantillas
+  (docxtpl crea uno nuevo en cada render si no se le pasa). Sus plantillas
+  compiladas quedan en memoria y el bytecode en .jinja_cache/, así la
+  compilación de Jinja se hace una vez y sobrevive a reinicios del servidor.
+- Cada render usa una instancia NUEVA (render muta el documento), pero
+  sin releer el archivo del disco ni repetir el parchado del XML.
+- renderizar_docx() devuelve directamente los bytes del .docx final y los
+  cachea por (plantilla, fecha de modificación, contexto): re-enviar el mismo
+  formulario o el rerun que provoca el botón de descarga no vuelven a renderizar.
+- renderizar_en_paralelo() reparte varias plantillas en un pool de hilos.
+  El render de Jinja es Python puro y no suelta el GIL; solo pueden solaparse
+  las partes en C (lxml, compresión del zip), así que la ganancia es acotada.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import os
+import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import jinja2
+import streamlit as st
+from docxtpl import DocxTemplate
+
+
+JINJA_CACHE_DIR = ".jinja_cache"
+
+# Fuentes de plantilla registradas por entorno (= cache_size de Jinja)
+MAX_FUENTES = 400
+
+# docxtpl (render_xml_part) separa cada párrafo en su propia línea antes de
+# compilar; lo replicamos al precompilar para que la fuente sea idéntica.
+_RE_PARRAFO = re.compile(r"<w:p([ >])")
+
+
+class _EntornoPlantillas(jinja2.Environment):
+    """
+    docxtpl compila con from_string(), que en Jinja no pasa por ningún caché.
+    Aquí cada fuente se registra con un nombre = hash de su contenido y se
+    obtiene con get_template(), que sí usa el caché de plantillas en memoria
+    y el de bytecode en disco.
+    Las fuentes se guardan en un LRU del mismo tamaño que el caché de Jinja:
+    una fuente descartada solo hace falta si vuelve a llegar, y en ese caso
+    from_string la registra de nuevo antes de pedirla.
+    """
+
+    def __init__(self, **kwargs):
+        self._fuentes = OrderedDict()
+        super().__init__(loader=jinja2.FunctionLoader(self._fuentes.get), **kwargs)
+
+    def from_string(self, source, globals=None, template_class=None):
+        if not isinstance(source, str):
+            return super().from_string(source, globals, template_class)
+        nombre = _nombre_plantilla(source, self.autoescape)
+        self._fuentes[nombre] = source
+        self._fuentes.move_to_end(nombre)
+        while len(self._fuentes) > MAX_FUENTES:
+            self._fuentes.popitem(last=False)
+        return self.get_template(nombre, globals=globals)
+
+
+def _nombre_plantilla(source: str, autoescape) -> str:
+    modo = "ae" if autoescape else "raw"
+    return f"{modo}-{hashlib.sha1(source.encode('utf-8')).hexdigest()}"
+
+
+@st.cache_resource(show_spinner=False)
+def entorno_jinja(autoescape: bool = False):
+    """Environment compartido por todos los renders con el mismo autoescape."""
+    os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+    return _EntornoPlantillas(
+        autoescape=autoescape,
+        auto_reload=False,
+        cache_size=MAX_FUENTES,
+        bytecode_cache=jinja2.FileSystemBytecodeCache(JINJA_CACHE_DIR),
+    )
+
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def _plantilla_base(ruta: str, mtime: float) -> Tuple[bytes, str, Dict[str, str]]:
+    """
+    Bytes del .docx, XML del cuerpo ya parchado por docxtpl y un dict
+    (XML original -> parchado) para encabezados y pies de página, que se
+    llena en el primer render. Vive y se descarta con la entrada del caché.
+    """
+    with open(ruta, "rb") as f:
+        datos = f.read()
+
+    tpl = DocxTemplate(io.BytesIO(datos))
+    tpl.init_docx()
+    return datos, tpl.patch_xml(tpl.get_xml()), {}
+
+
+class PlantillaDocx(DocxTemplate):
+    """
+    DocxTemplate que parte de los bytes cacheados y reutiliza el XML
+    parchado del cuerpo; solo queda por hacer el render de Jinja.
+    """
+
+    def __init__(self, ruta: str):
+        datos, xml_cuerpo, parchados = _plantilla_base(ruta, os.path.getmtime(ruta))
+        super().__init__(io.BytesIO(datos))
+        self.ruta = ruta
+        self._xml_cuerpo = xml_cuerpo
+        self._parchados = parchados
+
+    def render(self, context, jinja_env=None, autoescape=False):
+        if jinja_env is None:
+            jinja_env = entorno_jinja(autoescape)
+        super().render(context, jinja_env=jinja_env, autoescape=autoescape)
+
+    def build_xml(self, context, jinja_env=None):
+        return self.render_xml_part(self._xml_cuerpo, self.docx._part, context, jinja_env)
+
+    def patch_xml(self, src_xml):
+        # Las ~20 pasadas de regex de docxtpl dependen solo del texto de entrada:
+        # se hacen una vez por parte distinta de esta plantilla y luego se reutilizan.
+        parchado = self._parchados.get(src_xml)
+        if parchado is None:
+            parchado = self._parchados[src_xml] = super().patch_xml(src_xml)
+        return parchado
+
+    def map_tree(self, tree):
+        # docxtpl hace root.replace(body, tree): lxml desprende y reconcilia
+        # namespaces de todo el subárbol. Movemos solo los hijos al <w:body>
+        # existente, que además sigue siendo el mismo objeto para python-docx.
+        body = self.docx._element.body
+        for hijo in list(body):
+            body.remove(hijo)
+        body.extend(list(tree))
+
+
+def cargar_plantilla(ruta: str) -> PlantillaDocx:
+    """Instancia lista para render() de la plantilla en `ruta`."""
+    return PlantillaDocx(ruta)
+
+
+def precalentar(rutas: Iterable[str], autoescape: bool = False) -> None:
+    """
+    Carga en caché las plantillas indicadas y precompila el cuerpo con Jinja
+    (las que no existen se ignoran).
+    """
+    entorno = entorno_jinja(autoescape)
+    for ruta in rutas:
+        if os.path.exists(ruta):
+            _, xml_cuerpo, _ = _plantilla_base(ruta, os.path.getmtime(ruta))
+            entorno.from_string(_RE_PARRAFO.sub(r"\n<w:p\1", xml_cuerpo))
+
+
+def _render_a_bytes(doc: PlantillaDocx, contexto: dict, autoescape: bool, jinja_env=None) -> bytes:
+    doc.render(contexto, jinja_env=jinja_env, autoescape=autoescape)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def _docx_bytes(ruta: str, contexto: dict, autoescape: bool) -> bytes:
+    return _render_a_bytes(cargar_plantilla(ruta), contexto, autoescape)
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def _docx_bytes_cached(
+    ruta: str, mtime: float, clave_contexto: str, autoescape: bool, _contexto: dict
+) -> bytes:
+    # `_contexto` no entra en la clave de caché (prefijo "_"): la clave es
+    # `clave_contexto` y el render usa el contexto original, sin convertir.
+    return _docx_bytes(ruta, _contexto, autoescape)
+
+
+def renderizar_docx(ruta: str, contexto: dict, autoescape: bool = False) -> bytes:
+    """
+    Bytes del .docx de `ruta` renderizado con `contexto`, listos para
+    st.download_button(data=...). Los errores (p. ej. TemplateSyntaxError)
+    se propagan y no se cachean.
+    """
+    # El JSON solo sirve de clave. repr() distingue un date de su texto; los
+    # objetos sin repr estable (RichText...) simplemente no aciertan el caché.
+    clave_contexto = json.dumps(contexto, sort_keys=True, ensure_ascii=False, default=repr)
+    return _docx_bytes_cached(ruta, os.path.getmtime(ruta), clave_contexto, autoescape, contexto)
+
+
+@st.cache_resource(show_spinner=False)
+def _pool_render() -> ThreadPoolExecutor:
+    """Pool compartido de renderizar_en_paralelo; se crea en el primer uso."""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="docx")
+
+
+def renderizar_en_paralelo(trabajos: Sequence[Tuple[str, dict, bool]]) -> List[bytes]:
+    """
+    Renderiza cada (ruta, contexto, autoescape) en el pool y devuelve los bytes
+    en el mismo orden. Plantilla y Environment se obtienen en el hilo de
+    Streamlit (sus cachés usan el contexto de la sesión); los hilos solo hacen
+    el render y el guardado. Si alguno falla, se propaga su excepción.
+    """
+    pool = _pool_render()
+    futuros = [
+        pool.submit(_render_a_bytes, cargar_plantilla(ruta), contexto, autoescape, entorno_jinja(autoescape))
+        for ruta, contexto, autoescape in trabajos
+    ]
+    return [f.result() for f in futuros]
@@ -1,25 +1,39 @@
 import os, re
-import pandas as pd
-from datetime import datetime
+from functools import lru_cache
+from datetime import date, datetime
 from unidecode import unidecode
 
 def asegurar_dirs():
     os.makedirs("salidas", exist_ok=True)
     os.makedirs("plantillas", exist_ok=True)
 
+_SLUG_INVALIDOS = re.compile(r"[^a-z0-9\-_. ]+")
+_SLUG_ESPACIOS = re.compile(r"\s+")
+
 def slugify(texto: str) -> str:
     t = unidecode(str(texto)).lower().strip()
-    t = re.sub(r"[^a-z0-9\-_. ]+", "", t)
-    t = re.sub(r"\s+", "_", t)
+    t = _SLUG_INVALIDOS.sub("", t)
+    t = _SLUG_ESPACIOS.sub("_", t)
     return t[:100] or "documento"
 
+# Caracteres prohibidos en nombres de archivo -> "_", saltos de línea -> " "
+_FN_TABLE = str.maketrans({**{c: "_" for c in '<>:"/\\|?*'}, "\n": " ", "\r": " "})
+
 def safe_filename_pretty(texto: str) -> str:
-    prohibidos = '<>:"/\\|?*'
-    limpio = ''.join('_' if c in prohibidos else c for c in str(texto))
-    return limpio.replace('\n', ' ').replace('\r', ' ').strip()
+    return str(texto).translate(_FN_TABLE).strip()
+
+_MESES = (
+    "enero","febrero","marzo","abril","mayo","junio",
+    "julio","agosto","setiembre","octubre","noviembre","diciembre"
+)
 
 def fmt_fecha_corta(d) -> str:
     """15/09/2025"""
+    # st.date_input ya da un `date`: se formatea directo, sin pasar por pandas
+    # (tipo exacto: pd.Timestamp / NaT siguen por pandas como antes)
+    if type(d) in (date, datetime):
+        return d.strftime("%d/%m/%Y")
+    import pandas as pd  # diferido: importar utils no debe cargar pandas
     try:
         return pd.to_datetime(d).strftime("%d/%m/%Y")
     except Exception:
@@ -27,13 +41,12 @@ def fmt_fecha_corta(d) -> str:
 
 def fmt_fecha_larga(d) -> str:
     """16 de setiembre del 2025 (con 'del')"""
-    meses = [
-        "enero","febrero","marzo","abril","mayo","junio",
-        "julio","agosto","setiembre","octubre","noviembre","diciembre"
-    ]
+    if type(d) in (date, datetime):
+        return f"{d.day} de {_MESES[d.month-1]} del {d.year}"
+    import pandas as pd
     try:
         dt = pd.to_datetime(d)
-        return f"{dt.day} de {meses[dt.month-1]} del {dt.year}"
+        return f"{dt.day} de {_MESES[dt.month-1]} del {dt.year}"
     except Exception:
         return ""
 
@@ -42,6 +55,8 @@ def fmt_fecha_larga_de(d) -> str:
     return fmt_fecha_larga(d).replace(" del ", " de ")
 
 # 👇 Alias pensado para usar en anuncios (más semántico)
+# Cacheado: en anuncios siempre llega un `date` (hashable) y casi siempre el de hoy.
+@lru_cache(maxsize=256)
 def fecha_larga(d) -> str:
     """Alias de fmt_fecha_larga, para usar como fecha_larga(fecha)."""
     return fmt_fecha_larga(d)
@@ -69,4 +84,23 @@ def build_vigencia2(fecha_inicio, fecha_fin) -> str:
     return f"{i} - {f}"
 
 def to_upper(s: str) -> str:
-    return (s or "").strip().upper()
+    if not s:
+        return ""
+    s = s.strip()
+    # Casi todo se escribe ya en mayúsculas: sin copia nueva en ese caso
+    return s if s.isupper() else s.upper()
+
+def tamano_grilla(ws) -> tuple:
+    """
+    (filas, columnas) actuales de la grilla de una worksheet de gspread, leídas
+    de Sheets: el row_count/col_count de un handle cacheado puede estar viejo.
+    """
+    meta = ws.spreadsheet.fetch_sheet_metadata(
+        {"fields": "sheets(properties(sheetId,gridProperties(rowCount,columnCount)))"}
+    )
+    for hoja in meta.get("sheets", []):
+        props = hoja.get("properties", {})
+        if props.get("sheetId") == ws.id:
+            grilla = props.get("gridProperties", {})
+            return grilla.get("rowCount", 0), grilla.get("columnCount", 0)
+    return ws.row_count, ws.col_count